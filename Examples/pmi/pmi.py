@@ -60,8 +60,7 @@ def word_counter(rows):
 
 graph = mrop.ComputationalGraph(source=graph_split_words)
 graph.name = 'filter_words_graph'
-graph.add_operation(mrop.Join(on=graph_count_docs, key=['word', 'docs_count'],
-                              strategy='outer'))
+graph.add_operation(mrop.Join(on=graph_count_docs))
 graph.add_operation(mrop.Sort(key=['word', 'doc_id']))
 graph.add_operation(mrop.Reduce(filter_by_presence_in_two_docs, key=['word']))
 graph.add_operation(mrop.Reduce(word_counter, key=['word']))
@@ -75,20 +74,19 @@ def freq_of_word_in_doc(rows):
     }
 
 
-def compute_pmi_select_top_ten(rows):
-    for index in range(len(rows)):
-        rows[index] = {
-            'doc_id': rows[index]['doc_id'],
-            'word': rows[index]['word'],
-            'pmi': math.log(rows[index]['frequency in doc'] /
-                            rows[index]['frequency of word in all docs'])
-        }
+def compute_pmi(row):
+    yield {
+        'doc_id': row['doc_id'],
+        'word': row['word'],
+        'pmi': math.log(row['frequency in doc'] /
+                        row['frequency of word in all docs'])
+    }
+
 
-    rows = sorted(rows, key=lambda item: -item['pmi'])
-    top_words = [item['word'] for item in rows]
+def collect_top_words(rows):
     yield {
         'doc_id': rows[0]['doc_id'],
-        'top_pmi_words': top_words[:10]
+        'top_pmi_words': [row['word'] for row in rows]
     }
 
 
@@ -98,7 +96,9 @@ graph_calc_pmi.add_operation(mrop.Sort(['doc_id', 'word']))
 graph_calc_pmi.add_operation(mrop.Reduce(freq_of_word_in_doc, ['doc_id', 'word']))
 graph_calc_pmi.add_operation(mrop.Join(on=graph, key='word', strategy='left'))
 graph_calc_pmi.add_operation(mrop.Sort(['doc_id']))
-graph_calc_pmi.add_operation(mrop.Reduce(compute_pmi_select_top_ten, key=['doc_id']))
+graph_calc_pmi.add_operation(mrop.Map(compute_pmi))
+graph_calc_pmi.add_operation(mrop.TopK(10, key=['pmi'], group_by=['doc_id']))
+graph_calc_pmi.add_operation(mrop.Reduce(collect_top_words, key=['doc_id']))
 
 graph_calc_pmi.run(main_input=open('text_corpus.txt', 'r'),
                    save_result=open('pmi_output.txt', 'w'), verbose=True)
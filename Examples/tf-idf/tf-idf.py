@@ -23,10 +23,6 @@ def split_text_with_doc_id(row):
         }
 
 
-def unique(rows):
-    yield rows[0]
-
-
 def docs_with_particular_word_counter(rows):
     yield {
         'word': rows[0]['word'],
@@ -50,8 +46,9 @@ graph_split_words.add_operation(mrop.Map(split_text_with_doc_id))
 graph_count_idf = mrop.ComputationalGraph(source=graph_split_words)
 graph_count_idf.name = 'count idf graph'
 graph_count_idf.add_operation(mrop.Sort(['doc_id', 'word']))
-graph_count_idf.add_operation(mrop.Reduce(unique, ['doc_id', 'word']))
-graph_count_idf.add_operation(mrop.Join(on=graph_count_docs, key = ['word', 'docs_count'], strategy='outer'))
+graph_count_idf.add_operation(mrop.Reduce(mrop.first_row(), ['doc_id', 'word'],
+                                          streaming=True))
+graph_count_idf.add_operation(mrop.Join(on=graph_count_docs))
 graph_count_idf.add_operation(mrop.Sort(['word']))
 graph_count_idf.add_operation(mrop.Reduce(docs_with_particular_word_counter, ['word']))
 graph_count_idf.add_operation(mrop.Map(calc_idf))
@@ -65,22 +62,18 @@ def freq_of_word_in_doc(rows):
     }
 
 
-def compute_tf_idf_select_top_three(rows):
-    for index in range(len(rows)):
-        rows[index] = {
-            'doc_id': rows[index]['doc_id'],
-            'word': rows[index]['word'],
-            'tf-idf': rows[index]['frequency']*rows[index]['idf']
-        }
-    rows = sorted(rows, key=lambda item: -item['tf-idf'])
-    top_docs = tuple(item['doc_id'] for item in rows[:3])
-    top_tf_idf = tuple(item['tf-idf'] for item in rows[:3])
+def compute_tf_idf(row):
+    yield {
+        'doc_id': row['doc_id'],
+        'word': row['word'],
+        'tf-idf': row['frequency']*row['idf']
+    }
 
-    index = list(zip(top_docs, top_tf_idf))
 
+def build_index(rows):
     yield {
         "word": rows[0]['word'],
-        'index': index
+        'index': [(row['doc_id'], row['tf-idf']) for row in rows]
     }
 
 
@@ -90,7 +83,9 @@ graph_calc_index.add_operation(mrop.Sort(['doc_id', 'word']))
 graph_calc_index.add_operation(mrop.Reduce(freq_of_word_in_doc, ['doc_id', 'word']))
 graph_calc_index.add_operation(mrop.Join(on=graph_count_idf, key='word', strategy='left'))
 graph_calc_index.add_operation(mrop.Sort(['word']))
-graph_calc_index.add_operation(mrop.Reduce(compute_tf_idf_select_top_three, key=['word']))
+graph_calc_index.add_operation(mrop.Map(compute_tf_idf))
+graph_calc_index.add_operation(mrop.TopK(3, key=['tf-idf'], group_by=['word']))
+graph_calc_index.add_operation(mrop.Reduce(build_index, key=['word']))
 
 graph_calc_index.run(main_input=open('text_corpus.txt', 'r'),
                      save_result=open('tf_idf_output.txt', 'w'))
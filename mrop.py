@@ -1,12 +1,33 @@
+import os
 import json
+import math
+import asyncio
+import operator
+import copy
+import heapq
+import bisect
+import pickle
+import random
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import tracemalloc
+import traceback
+import multiprocessing
+from hashlib import blake2b
+from functools import partial
+from collections import deque
 from operator import itemgetter
-from itertools import groupby
+from itertools import groupby, chain, islice, repeat
+from multiprocessing.connection import Listener, Client, wait
 
 
 class ComputationalGraph(object):
     """
     :attribute list_of_operations (list of ComputationalGraph objects):
-    list of operations (Map, Sort, Reduce, Fold or Join) in the instance
+    list of operations (Map, Sort, Reduce, Fold, TopK or Join) in the instance
     of ComputationalGraph class (instance is linear graph).
 
     :attribute result (list of dicts): result table after applying whole
@@ -50,12 +71,15 @@ class ComputationalGraph(object):
     connected with each other only inside one linear graph.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, schema=None):
         """
         Create new line graph object
         :param source (file object of ComputationalGraph object): source
         of data for instance of class.
         Source might be file or output of another graph.
+        :param schema (list of strings, default None): columns of input
+        rows of the graph. If schema is specified, input rows are stored
+        as compact Record objects (see Record below);
         Example of code:
             graph = mrop.ComputationalGraph(source = graph_split_words),
             where graph_split_words is an instance of an
@@ -65,6 +89,7 @@ class ComputationalGraph(object):
             'main_input' will be specified in final_graph.run command;
         """
         self.source = source
+        self.schema = schema
         self.list_of_operations = []
         self.result = []
         self.dependencies = []
@@ -100,42 +125,395 @@ class ComputationalGraph(object):
         :attribute dict_of_input_files (dict): dictionary of input
         files. It's used to specify source files for graphs.
 
-        :param kwargs (dict): dict with input files, output files and
-        verbose.
+        :attribute sample_report (list of dicts): rows produced by each
+        operation in sample run (see Sample below) and their number
+        extrapolated to the whole input.
+
+        :param kwargs (dict): dict with input files, output files,
+        verbose, sample (Sample object, run graphs on a sample of
+        input files), checkpoint_dir (directory to save result of each
+        linear graph to), resume (bool, take results of graphs from
+        valid checkpoints in checkpoint_dir instead of running them) and
+        cluster (LocalCluster object, run graphs on worker processes;
+        sample and checkpoints are not supported with cluster).
 
         Example of code:
         graph_calc_pmi.run(main_input=open('text_corpus.txt', 'r'),
                    save_result=open('pmi_output.txt', 'w'))
         """
+        if kwargs.get('cluster') is not None:
+            for name in ('sample', 'checkpoint_dir', 'resume'):
+                if kwargs.get(name):
+                    raise ValueError("{} is not supported with cluster".
+                                     format(name))
+        self.prepare_run(kwargs)
+        self.file_to_save_result = kwargs['save_result']
+
+        if kwargs.get('cluster') is not None:
+            for graph in self.sorted_graphs:
+                graph.rows_count = []
+            kwargs['cluster'].run_graphs(self.sorted_graphs, self.global_cache,
+                                         self.dict_of_input_files)
+            self.write_result()
+            return
+
+        checkpoints = None
+        if kwargs.get('checkpoint_dir') is not None:
+            checkpoints = Checkpoints(kwargs['checkpoint_dir'],
+                                      self.sorted_graphs, kwargs)
+
+        for index, graph in enumerate(self.sorted_graphs):
+            if checkpoints is not None and kwargs.get('resume') and \
+                    checkpoints.load(index):
+                if self.global_cache['verbose']:
+                    print("result of graph {} was loaded from checkpoint".
+                          format(index))
+                graph.rows_count = []
+                graph.collect_statistics()
+                if graph.is_final_graph:
+                    graph.write_result()
+                continue
+            graph.run_graph(self.global_cache, self.dict_of_input_files)
+            if checkpoints is not None:
+                graph.spill = checkpoints.save(index)
+
+        if self.global_cache['sample'] is not None:
+            self.report_sample()
+
+    def prepare_run(self, kwargs):
+        """
+        Prepare run of final graph: create global cache and perform
+        topological sorting of graphs.
+        :param kwargs (dict): kwargs of run;
+        """
         self.global_cache = {}
         if 'verbose' in kwargs:
             if kwargs['verbose'] is True:
                 self.global_cache['verbose'] = True
+            else:
+                self.global_cache['verbose'] = False
         else:
             self.global_cache['verbose'] = False
-        self.file_to_save_result = kwargs['save_result']
-        self.is_final_graph = True
+        self.global_cache['sample'] = kwargs.get('sample')
+        self.global_cache['sample_scale'] = {}
+        self.global_cache['analyze'] = kwargs.get('analyze', False)
         self.dict_of_input_files = kwargs
 
         # dependencies of graph will be executed first
 
         if self.global_cache['verbose']:
             print("Topological sorting was started")
+        self.sorted_graphs = []
         self.topological_sorting(self.sorted_graphs)
+        for index, graph in enumerate(self.sorted_graphs):
+            graph.color = 'white'  # graphs might be sorted again
+            graph.is_final_graph = False
+            graph.label = getattr(graph, 'name', 'graph_{}'.format(index))
+            graph.spill = 0
+        self.is_final_graph = True
         if self.global_cache['verbose']:
             print("Topological sorting was successfully finished")
+        self.plan_statistics()
 
         if self.global_cache['verbose']:
             print("topological order is:")
             for graph in self.sorted_graphs:
-                try:
-                    print(graph.name)
-                except AttributeError as e:
-                    print("Please give names to all graphs if you want to see"
-                          "the topological order")
+                print(graph.label)
 
+    def plan_statistics(self):
+        """
+        Choose statistics to collect for each graph in sorted_graphs, so
+        that only statistics which the planner uses are collected:
+        - keys to check sortedness by: keys of the first Sort of graphs
+        which read the graph and join keys of Joins with the graph;
+        - keys to count distinct values of: keys of the first Sort of
+        graphs which read the graph, if Sort is followed by Reduce by
+        the same keys;
+        """
+        for graph in self.sorted_graphs:
+            graph.statistics_keys = []
+            graph.statistics_groups = []
+        for graph in self.sorted_graphs:
+            operations = [operation for operation in graph.list_of_operations
+                          if not isinstance(operation, InputDataNode)]
+            if isinstance(graph.source, ComputationalGraph) and operations \
+                    and isinstance(operations[0], Sort):
+                keys = operations[0].keys_to_compare
+                graph.source.statistics_keys.append(keys)
+                if len(operations) > 1 and \
+                        isinstance(operations[1], Reduce) and \
+                        operations[1].keys_to_group_by == keys:
+                    graph.source.statistics_groups.append(keys)
+            for operation in operations:
+                if isinstance(operation, Join) and \
+                        operation.key2 is not None:
+                    operation.on.statistics_keys.append([operation.key2])
         for graph in self.sorted_graphs:
+            graph.statistics_keys = list(map(list, dict.fromkeys(
+                map(tuple, graph.statistics_keys))))
+            graph.statistics_groups = list(map(list, dict.fromkeys(
+                map(tuple, graph.statistics_groups))))
+
+    async def run_async(self, executor=None, chunk_size=1000, **kwargs):
+        """
+        Run final graph from asyncio code and yield rows of its result.
+        Graphs are computed in executor, so event loop is not blocked.
+        Rows of final graph are computed by chunks and yielded as soon as
+        they are ready.
+
+        Inputs might be async iterables, iterables or files with
+        json-lines or dicts. Result is not written to file and is not
+        saved to result of the final graph.
+
+        NOTE: graph objects keep state of run, so don't run the same
+        graphs concurrently; create separate graphs for concurrent jobs.
+
+        :param executor (concurrent.futures.Executor, default None):
+        executor to compute graphs in (default executor of event loop if
+        None). Graphs are not pickled, so it should be a thread pool;
+        :param chunk_size (int): number of rows of final graph computed
+        at once;
+        :param kwargs (dict): dict with inputs, verbose and sample (like
+        in run). Rows of records (see Record) are yielded as dicts, like
+        rows written by run; cluster and checkpoints are not supported;
+
+        Example of code:
+            async for row in graph.run_async(main_input=lines):
+                await websocket.send(json.dumps(row))
+        """
+        for name in ('cluster', 'checkpoint_dir', 'resume'):
+            if kwargs.get(name):
+                raise ValueError("{} is not supported by run_async".
+                                 format(name))
+        loop = asyncio.get_running_loop()
+        for name, value in list(kwargs.items()):
+            if hasattr(value, '__aiter__'):
+                kwargs[name] = [item async for item in value]
+        self.prepare_run(kwargs)
+        for graph in self.sorted_graphs[:-1]:
+            await loop.run_in_executor(executor, graph.run_graph,
+                                       self.global_cache,
+                                       self.dict_of_input_files)
+        await loop.run_in_executor(executor, self.prepare_graph,
+                                   self.global_cache,
+                                   self.dict_of_input_files)
+        self.list_of_operations[0].global_cache = self.global_cache
+        while True:
+            chunk = await loop.run_in_executor(
+                executor, list, islice(self.previous_node, chunk_size))
+            if not chunk:
+                break
+            for row in chunk:
+                if isinstance(row, Record):
+                    row = row.to_dict()
+                yield row
+        if self.global_cache['sample'] is not None:
+            self.report_sample()
+
+    def run_stream(self, window, **kwargs):
+        """
+        Run final graph on windows of unbounded input of json-lines, e.g.
+        pipe or file followed by follow function, and yield result of
+        each window as soon as the window is closed. Fold, Reduce, TopK,
+        etc. work on rows of one window, so memory depends on size of
+        windows, not on the whole input.
+
+        Source of final graph should be an input; graphs it depends on
+        (e.g. joined graphs) are run once before the stream and shouldn't
+        read the streamed input.
+
+        :param window (Window object): windows of the input of final
+        graph;
+        :param kwargs (dict): inputs and verbose (like in run);
+        :return: iterator on windows (start, end, rows), rows are dicts
+        (records are converted, like in run);
+
+        Example of code:
+            for start, end, rows in graph.run_stream(
+                    mrop.Window(size=1000), main_input=sys.stdin):
+                print(start, end, rows)
+        """
+        for name in ('sample', 'cluster', 'checkpoint_dir', 'resume'):
+            if kwargs.get(name):
+                raise ValueError("{} is not supported by run_stream".
+                                 format(name))
+        if not isinstance(self.source, str):
+            raise TypeError("source of graph in run_stream should be an "
+                            "input")
+        self.prepare_run(kwargs)
+        for graph in self.sorted_graphs[:-1]:
+            if graph.source == self.source:
+                raise ValueError("{} reads the streamed input {}".format(
+                    graph.label, self.source))
             graph.run_graph(self.global_cache, self.dict_of_input_files)
+        rows = map(parse_row, skip_empty_lines(kwargs[self.source]))
+        try:
+            for start, end, window_rows in window.split(rows):
+                self.global_cache[self.source] = window_rows
+                self.prepare_graph(self.global_cache,
+                                   self.dict_of_input_files)
+                self.compute_graph(self.global_cache)
+                yield start, end, [row.to_dict()
+                                   if isinstance(row, Record) else row
+                                   for row in self.result]
+        finally:
+            self.global_cache.pop(self.source, None)
+
+    def explain(self, analyze=False, format='text', **kwargs):
+        """
+        Describe plan of the job: linear graphs in topological order with
+        their sources, dependencies and operations with their keys and
+        chosen algorithms (see plan_graph and Join).
+
+        Without analyze the job isn't run. Join chooses its algorithm
+        when both tables are ready, so it is known only after a run.
+        Rows of graphs are taken from statistics of previous run and
+        estimated rows of operations from previous sample run, if any.
+
+        With analyze=True the job is run and each operation is annotated
+        with actual number of rows, time and peak memory (the largest
+        growth of memory traced by tracemalloc while the operation
+        produced a row, including previous operations it pulled rows
+        from, see profiled), each graph with its time, peak memory and
+        spill (size of checkpoint in bytes).
+
+        :param analyze (bool): run the job and collect actual costs;
+        :param format (str): 'text', 'dot' (graphviz) or 'json';
+        :param kwargs (dict): kwargs of run (inputs, save_result, etc.);
+        :return: plan (str);
+
+        Example of code:
+            print(graph.explain(analyze=True,
+                                main_input=open('text_corpus.txt', 'r'),
+                                save_result=open('output.txt', 'w')))
+        """
+        if format not in ('text', 'dot', 'json'):
+            raise ValueError("format of explain should be text, dot or "
+                             "json")
+        if analyze:
+            if kwargs.get('cluster') is not None:
+                raise ValueError("explain with analyze doesn't support "
+                                 "cluster")
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            try:
+                self.run(analyze=True, **kwargs)
+            finally:
+                if not tracing:
+                    tracemalloc.stop()
+        else:
+            self.prepare_run(kwargs)
+            for graph in self.sorted_graphs:
+                graph.plan_graph()
+        plan = self.plan(analyze)
+        if format == 'json':
+            return json.dumps(plan, indent=2)
+        if format == 'dot':
+            return _render_plan_dot(plan)
+        return _render_plan_text(plan)
+
+    def plan(self, analyze=False):
+        """
+        :param analyze (bool): add actual costs of last run;
+        :return: plan of the job (dict) for explain: list of graphs with
+        their operations;
+        """
+        graphs = []
+        for index, graph in enumerate(self.sorted_graphs):
+            statistics = getattr(graph, 'statistics', None)
+            entry = {
+                'index': index,
+                'graph': graph.label,
+                'source': describe_source(graph.source),
+                'source_index': self.sorted_graphs.index(graph.source)
+                if isinstance(graph.source, ComputationalGraph) else None,
+                'dependencies': [dependency.label
+                                 for dependency in graph.dependencies],
+                'rows': None,
+                'operations': []
+            }
+            if statistics is not None:
+                entry['rows'] = statistics.rows
+                entry['sorted_by'] = statistics.sorted_by
+                entry['distinct'] = statistics.distinct
+            analyzed = analyze and bool(graph.rows_count)
+            if analyze:
+                entry['restored'] = not analyzed
+                entry['spill'] = graph.spill
+            if analyzed:
+                entry['time'] = round(sum(profile['time']
+                                          for profile in graph.profile), 6)
+                entry['peak_memory'] = graph.peak_memory
+            estimated_rows = getattr(graph, 'estimated_rows', [])
+            for operation_index, operation in \
+                    enumerate(graph.list_of_operations):
+                node = {'operation': type(operation).__name__,
+                        'description': repr(operation)}
+                if isinstance(operation, Join):
+                    node['on_index'] = self.sorted_graphs.index(operation.on)
+                if hasattr(operation, 'algorithm'):
+                    node['algorithm'] = operation.algorithm
+                    node['note'] = operation.algorithm_note
+                if operation_index < len(estimated_rows):
+                    node['estimated_rows'] = estimated_rows[operation_index]
+                if analyzed:
+                    profile = graph.profile[operation_index]
+                    node['rows'] = graph.rows_count[operation_index]
+                    node['time'] = round(profile['time'], 6)
+                    node['peak_memory'] = profile['peak_memory']
+                entry['operations'].append(node)
+            graphs.append(entry)
+        return {'graphs': graphs}
+
+    def report_sample(self):
+        """
+        Make and print sample_report: for each operation of each graph
+        the number of rows it produced on a sample and this number
+        multiplied by the sampling scale of the graph input.
+        Number of rows of operations with fixed size of output (Fold and
+        global TopK, ApproxDistinct and HeavyHitters) and of operations
+        after them isn't extrapolated, until Join brings rows of another
+        graph. Estimated numbers are also kept in estimated_rows of graphs
+        (see explain).
+        """
+        self.sample_report = []
+        scaled_output = {}
+        for index, graph in enumerate(self.sorted_graphs):
+            scale = graph.sample_scale(self.global_cache['sample_scale'])
+            scaled = scaled_output.get(id(graph.source), True)
+            graph.estimated_rows = []
+            for operation, rows in zip(graph.list_of_operations,
+                                       graph.rows_count):
+                if isinstance(operation, Join):
+                    scaled = scaled or scaled_output[id(operation.on)]
+                if _has_fixed_size(operation):
+                    scaled = False
+                estimated_rows = rows
+                if scaled:
+                    estimated_rows = int(round(rows * scale))
+                graph.estimated_rows.append(estimated_rows)
+                self.sample_report.append({
+                    'graph': graph.label,
+                    'operation': type(operation).__name__,
+                    'rows': rows,
+                    'estimated_rows': estimated_rows
+                })
+            scaled_output[id(graph)] = scaled
+        print("Sample run with {}".format(self.global_cache['sample']))
+        for line in self.sample_report:
+            print("{graph}: {operation}: {rows} rows, "
+                  "~{estimated_rows} rows on whole input".format(**line))
+
+    def sample_scale(self, scales):
+        """
+        :param scales (dict): scale of each sampled input file;
+        :return: scale of the input file this graph is computed from;
+        """
+        source = self.source
+        while isinstance(source, ComputationalGraph):
+            source = source.source
+        return scales.get(source, 1.0)
 
     def topological_sorting(self, sorted_graphs: list):
         """
@@ -171,16 +549,51 @@ class ComputationalGraph(object):
         :param global_cache (dict);
         :param dict_of_input_files (dict);
         """
-        self.verbose = global_cache['verbose']
+        self.prepare_graph(global_cache, dict_of_input_files)
+        self.compute_graph(global_cache)
 
         if self.verbose:
-            if isinstance(self.source, ComputationalGraph):
-                print("Source for {} is {}".format(self.name, self.source.name))
+            print("{} was successfully computed".format(self.label))
+            for operation in self.list_of_operations:
+                if hasattr(operation, 'algorithm'):
+                    print("{}: {} by {} algorithm {}".format(
+                        self.label, type(operation).__name__,
+                        operation.algorithm, operation.algorithm_note))
+            print("statistics of {}: {}".format(self.label,
+                                                self.statistics))
 
-        self.list_of_operations.insert(0, InputDataNode(self.source))
+        # if isinstance(self.list_of_operations, InputDataNode):
+        #     if self.list_of_operations[0].source not in global_cache:
+        #         global_cache[self.list_of_operations[0].source] = \
+        #             self.list_of_operations[0].file_data
+
+        if self.is_final_graph:
+            if self.verbose:
+                print('writing output result from final graph to output file')
+            self.write_result()
+
+    def prepare_graph(self, global_cache, dict_of_input_files):
+        """
+        Set source of data of the graph and compile it.
+        :param global_cache (dict);
+        :param dict_of_input_files (dict);
+        """
+        self.verbose = global_cache['verbose']
+        self.sample = global_cache['sample']
+        self.analyze = global_cache['analyze']
+
+        if self.list_of_operations and \
+                isinstance(self.list_of_operations[0], InputDataNode):
+            # graph was already run
+            self.list_of_operations[0] = InputDataNode(self.source,
+                                                       self.schema)
+        else:
+            self.list_of_operations.insert(
+                0, InputDataNode(self.source, self.schema))
         if self.verbose:
-            print("run {}".format(self.name))
-            print("source for {} is {}".format(self.name, self.source))
+            print("run {}".format(self.label))
+            print("source for {} is {}".format(self.label,
+                                               describe_source(self.source)))
 
         if isinstance(self.source, str):
             self.list_of_operations[0].input_file = \
@@ -188,59 +601,107 @@ class ComputationalGraph(object):
         elif isinstance(self.source, ComputationalGraph):
             self.list_of_operations[0].result = self.source.result
 
+        self.plan_graph()
         self.compile_graph()
 
         if self.verbose:
             print("list of operations for {} is {}".
-                  format(self.name, self.list_of_operations))
+                  format(self.label, self.list_of_operations))
 
-        self.compute_graph(global_cache)
-
-        if self.verbose:
-            print("{} was successfully computed".format(self.name))
-
-        # if isinstance(self.list_of_operations, InputDataNode):
-        #     if self.list_of_operations[0].source not in global_cache:
-        #         global_cache[self.list_of_operations[0].source] = \
-        #             self.list_of_operations[0].file_data
-
-        if self.is_final_graph:
-            if self.verbose:
-                print('writing output result from final graph to output file')
-            for line in self.result:
-                self.file_to_save_result.write(json.dumps(line) + '\n')
-            self.file_to_save_result.close()
+    def write_result(self):
+        """
+        Write result of final graph to output file as json-lines.
+        """
+        for line in self.result:
+            if isinstance(line, Record):
+                line = line.to_dict()
+            self.file_to_save_result.write(json.dumps(line) + '\n')
+        self.file_to_save_result.close()
 
     def compile_graph(self):
         """
         Connect operations (nodes) in linear graph.
         For all operations in instance's list_of_operations get iterator
         from previous node to next node.
+        In sample run each iterator also counts rows to rows_count, in
+        analyzed run it also measures time and memory (see profiled).
         """
         if self.verbose:
-            print('starting to compile {}'.format(self.name))
+            print('starting to compile {}'.format(self.label))
             if len(self.dependencies) > 0:
-                print("dependencies of {} are:".format(self.name))
+                print("dependencies of {} are:".format(self.label))
                 for dependency in self.dependencies:
-                    try:
-                        print(dependency.name)
-                    except AttributeError as e:
-                        print(
-                            "Please give names to all graphs if you want to see"
-                            "the names of dependencies")
+                    print(dependency.label)
             else:
-                print("{} has no dependencies".format(self.name))
+                print("{} has no dependencies".format(self.label))
+        self.rows_count = [0] * len(self.list_of_operations)
+        self.profile = [{'time': 0.0, 'peak_memory': 0}
+                        for _ in self.list_of_operations]
+        self.peak_memory = None
         for index in range(len(self.list_of_operations)):
             if index == 0:
-                self.previous_node = iter(self.list_of_operations[0])
+                self.previous_node = self.count_rows_of(0)
                 continue
 
             self.list_of_operations[index]. \
                 set_iter_from_previous_node(self.previous_node)
 
-            self.previous_node = iter(self.list_of_operations[index])
+            self.previous_node = self.count_rows_of(index)
         if self.verbose:
-            print("{} was successfully compiled".format(self.name))
+            print("{} was successfully compiled".format(self.label))
+
+    def count_rows_of(self, index):
+        """
+        :param index (int): index of operation in list_of_operations;
+        :return: iterator on result of operation, which counts rows in
+        sample run and profiles operation in analyzed run;
+        """
+        operation_iter = iter(self.list_of_operations[index])
+        if self.analyze:
+            return self.profiled(operation_iter, index)
+        if self.sample is None:
+            return operation_iter
+        return self.counted(operation_iter, index)
+
+    def counted(self, operation_iter, index):
+        for row in operation_iter:
+            self.rows_count[index] += 1
+            yield row
+
+    def profiled(self, operation_iter, index):
+        """
+        Count rows of operation, time spent to get them and peak memory
+        (traced by tracemalloc): the largest growth of traced memory
+        while the operation produced one row, including memory of
+        previous operations it pulled rows from (e.g. the whole table
+        for Sort). Times include times of previous operations too, so
+        they are subtracted when the graph is computed (see
+        compute_graph).
+
+        tracemalloc has one peak, so the peak is reset before each step
+        and the peak of enclosing steps is kept in hidden_peak.
+        """
+        profile = self.profile[index]
+        while True:
+            enclosing_peak = max(tracemalloc.get_traced_memory()[1],
+                                 self.hidden_peak)
+            tracemalloc.reset_peak()
+            self.hidden_peak = 0
+            memory = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            try:
+                row = next(operation_iter)
+            except StopIteration:
+                return
+            finally:
+                profile['time'] += time.perf_counter() - started
+                peak = max(tracemalloc.get_traced_memory()[1],
+                           self.hidden_peak)
+                profile['peak_memory'] = max(profile['peak_memory'],
+                                             peak - memory)
+                self.hidden_peak = max(enclosing_peak, peak)
+            self.rows_count[index] += 1
+            yield row
 
     def compute_graph(self, global_cache):
         """
@@ -251,7 +712,73 @@ class ComputationalGraph(object):
         :param global_cache;
         """
         self.list_of_operations[0].global_cache = global_cache
-        self.result = list(self.list_of_operations[-1])
+        if self.analyze:
+            tracemalloc.reset_peak()
+            self.hidden_peak = 0
+            memory = tracemalloc.get_traced_memory()[0]
+        self.result = list(self.previous_node)
+        if self.analyze:
+            self.peak_memory = max(tracemalloc.get_traced_memory()[1],
+                                   self.hidden_peak) - memory
+            for index in range(len(self.profile) - 1, 0, -1):
+                self.profile[index]['time'] -= self.profile[index - 1]['time']
+        self.collect_statistics()
+
+    def collect_statistics(self):
+        """
+        Collect statistics of result (see Statistics), which were chosen
+        by plan_statistics.
+        """
+        self.statistics = Statistics.collect(
+            self.result, getattr(self, 'statistics_keys', ()),
+            getattr(self, 'statistics_groups', ()))
+
+    def plan_graph(self):
+        """
+        Choose algorithms of Sort and Reduce by statistics of source:
+        - Sort of input, which is already sorted by its keys, is skipped;
+        - Sort followed by Reduce by the same keys is replaced by
+        grouping of rows in dict (hash algorithm), if statistics show
+        that at most a half of keys of input are distinct, so groups are
+        big enough to pay for the dict. Otherwise (or if number of
+        distinct keys is unknown) rows are sorted;
+        Join chooses its algorithm itself, when both tables are ready.
+        """
+        source_statistics = None
+        if isinstance(self.source, ComputationalGraph):
+            source_statistics = getattr(self.source, 'statistics', None)
+        for index, operation in enumerate(self.list_of_operations):
+            if isinstance(operation, (Sort, Reduce)):
+                operation.algorithm = 'sort'
+                operation.algorithm_note = '(default)'
+        first = int(bool(self.list_of_operations) and
+                    isinstance(self.list_of_operations[0], InputDataNode))
+        for index, operation in enumerate(self.list_of_operations):
+            if not isinstance(operation, Sort):
+                continue
+            keys = operation.keys_to_compare
+            is_first = index == first and source_statistics is not None
+            if is_first and source_statistics.is_sorted_by(keys):
+                operation.algorithm = 'skip'
+                operation.algorithm_note = '(input is sorted by {})'. \
+                    format(keys)
+                continue
+            following = self.list_of_operations[index + 1:index + 2]
+            if not following or not isinstance(following[0], Reduce) or \
+                    following[0].keys_to_group_by != keys:
+                continue
+            share = source_statistics.distinct_share(keys) \
+                if is_first else None
+            if share is None:
+                operation.algorithm_note = '(number of groups is unknown)'
+                continue
+            if share > 0.5:
+                operation.algorithm_note = '(most keys are distinct)'
+                continue
+            operation.algorithm = 'skip'
+            operation.algorithm_note = '(rows are grouped by Reduce)'
+            following[0].algorithm = 'hash'
+            following[0].algorithm_note = '(groups are kept in dict)'
 
     def add_operation(self, new_operation):
         """
@@ -260,7 +787,7 @@ class ComputationalGraph(object):
         If new operation is Join, add Join.op to instance.dependencies.
 
         :param new_operation (BasicOperation's child object): and
-        instance of new operation (Map, Sort, Reduce, Fold or Join);
+        instance of new operation (Map, Sort, Reduce, Fold, TopK or Join);
         :return: list_of_operations in a linear graph;
         """
         if isinstance(new_operation, Join):
@@ -268,6 +795,274 @@ class ComputationalGraph(object):
         self.list_of_operations.append(new_operation)
 
 
+class Statistics(object):
+    """
+    Cheap statistics of result of linear graph, collected when result is
+    produced. Planner uses them to choose algorithms of operations of
+    dependent graphs (see ComputationalGraph.plan_graph and Join).
+
+    :attribute rows (int): number of rows;
+    :attribute sorted_by (list of lists of strings): keys result is
+    sorted by. Only keys which dependent graphs sort or join by are
+    checked;
+    :attribute distinct (dict): number of distinct values of keys which
+    dependent graphs group by (names of keys joined by comma) in a sample
+    of rows;
+    :attribute sampled (int): number of rows in the sample (every n-th
+    row of result, at most sample_size rows);
+    """
+
+    sample_size = 10000
+
+    def __init__(self, rows=0, sorted_by=None, distinct=None, sampled=0):
+        self.rows = rows
+        self.sorted_by = sorted_by or []
+        self.distinct = distinct or {}
+        self.sampled = sampled
+
+    @classmethod
+    def collect(cls, rows, keys_to_check=(), groups=()):
+        """
+        :param rows (list of rows): result of graph;
+        :param keys_to_check (list of lists of strings): keys to check
+        if rows are sorted by. Prefixes of keys rows are sorted by aren't
+        checked again;
+        :param groups (list of lists of strings): keys to count distinct
+        values of in a sample of rows;
+        :return: Statistics object;
+        """
+        sorted_by = []
+        for keys in sorted(keys_to_check, key=len, reverse=True):
+            if any(sorted_keys[:len(keys)] == list(keys)
+                   for sorted_keys in sorted_by) or \
+                    is_sorted(rows, list(keys)):
+                sorted_by.append(list(keys))
+        sample = rows[::len(rows) // cls.sample_size + 1] if groups else []
+        distinct = {}
+        for keys in groups:
+            try:
+                distinct[','.join(keys)] = len(set(map(
+                    key_getter(keys, sample[0]), sample)))
+            except (IndexError, KeyError, TypeError):
+                pass  # no rows, no such column or unhashable values
+        return cls(len(rows), sorted_by, distinct, len(sample))
+
+    def is_sorted_by(self, keys):
+        """
+        :param keys (list of strings);
+        :return: True if rows are known to be sorted by keys;
+        """
+        return any(sorted_keys[:len(keys)] == list(keys)
+                   for sorted_keys in self.sorted_by)
+
+    def distinct_share(self, keys):
+        """
+        :param keys (list of strings);
+        :return: share of distinct values of keys in the sample of rows
+        (float), None if it is unknown;
+        """
+        distinct = self.distinct.get(','.join(keys))
+        if distinct is None or not self.sampled:
+            return None
+        return distinct / self.sampled
+
+    def __repr__(self):
+        return "{} rows, sorted by {}, distinct {} in {} rows".format(
+            self.rows, self.sorted_by, self.distinct, self.sampled)
+
+
+class Checkpoints(object):
+    """
+    Checkpoints of results of linear graphs in local directory.
+
+    Result of each graph is saved to file graph_<index>.pkl (index in
+    topological order) in binary pickle format, after a fingerprint of
+    the graph. Fingerprint depends on operations of the graph (their
+    types, keys, names and code of functions, etc.), its source (name,
+    size and modification time of input file, or hash of content of
+    other inputs) and fingerprints of graphs it depends on, so the
+    checkpoint becomes invalid if any of them changes. Inputs which
+    can't be read twice (pipes, generators) have no fingerprint, so
+    graphs which depend on them are neither saved nor loaded. Files are
+    written to temporary file and then renamed, so a process killed
+    during saving never leaves a broken checkpoint.
+    """
+
+    def __init__(self, directory, sorted_graphs, input_files):
+        """
+        :param directory (str): directory for checkpoints (created if it
+        doesn't exist);
+        :param sorted_graphs (list of ComputationalGraph objects):
+        topological order of graphs;
+        :param input_files (dict): kwargs of run with input files;
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.sorted_graphs = sorted_graphs
+        self.fingerprints = []
+        fingerprint_of = {}
+        for index, graph in enumerate(sorted_graphs):
+            if isinstance(graph.source, ComputationalGraph):
+                source = fingerprint_of[id(graph.source)]
+            else:
+                source = self.describe_file(input_files.get(graph.source))
+            if source is None or any(
+                    fingerprint_of[id(dependency)] is None
+                    for dependency in graph.dependencies):
+                fingerprint_of[id(graph)] = None
+                self.fingerprints.append(None)
+                continue
+            description = repr((
+                index, getattr(graph, 'name', None), source,
+                graph.schema,
+                [self.describe_operation(operation)
+                 for operation in graph.list_of_operations
+                 if not isinstance(operation, InputDataNode)],
+                [fingerprint_of[id(dependency)]
+                 for dependency in graph.dependencies],
+                input_files.get('sample')))
+            fingerprint = blake2b(description.encode('utf-8')).hexdigest()
+            fingerprint_of[id(graph)] = fingerprint
+            self.fingerprints.append(fingerprint)
+
+    @staticmethod
+    def describe_file(input_file):
+        """
+        :param input_file (file object or iterable): input of run;
+        :return: description of input which changes with its content,
+        None if input can't be described without consuming it;
+        """
+        try:
+            status = os.fstat(input_file.fileno())
+        except (AttributeError, OSError, ValueError):
+            pass
+        else:
+            if not stat.S_ISREG(status.st_mode):
+                return None
+            return input_file.name, status.st_size, status.st_mtime
+        if isinstance(input_file, (list, tuple)):
+            content = repr(input_file)
+        elif getattr(input_file, 'seekable', lambda: False)():
+            position = input_file.tell()
+            content = repr(input_file.read())
+            input_file.seek(position)
+        else:
+            return None
+        return blake2b(content.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def describe_operation(cls, operation):
+        parameters = []
+        for name in BasicOperation.parameters:
+            if hasattr(operation, name):
+                parameters.append(
+                    (name, cls.describe_value(getattr(operation, name))))
+        return type(operation).__name__, parameters
+
+    @classmethod
+    def describe_function(cls, function, seen=()):
+        """
+        :return: description of function which changes with its code,
+        default arguments, closure or arguments of partial;
+        """
+        if isinstance(function, partial):
+            return (cls.describe_function(function.func, seen),
+                    [cls.describe_value(value, seen)
+                     for value in function.args],
+                    sorted((name, cls.describe_value(value, seen))
+                           for name, value in function.keywords.items()))
+        name = '{}.{}'.format(getattr(function, '__module__', None),
+                              getattr(function, '__qualname__',
+                                      repr(function)))
+        code = getattr(function, '__code__', None)
+        if code is None or id(function) in seen:
+            return name
+        seen = seen + (id(function),)
+        closure = []
+        for cell in getattr(function, '__closure__', None) or ():
+            try:
+                closure.append(cls.describe_value(cell.cell_contents, seen))
+            except ValueError:  # cell isn't filled yet
+                closure.append(None)
+        return (name, cls.describe_code(code),
+                cls.describe_value(getattr(function, '__defaults__', None),
+                                   seen), closure)
+
+    @classmethod
+    def describe_code(cls, code):
+        consts = tuple(cls.describe_code(const)
+                       if isinstance(const, type(code))
+                       else cls.describe_value(const)
+                       for const in code.co_consts)
+        return blake2b(repr((code.co_code, consts, code.co_names)).
+                       encode('utf-8')).hexdigest()
+
+    @classmethod
+    def describe_value(cls, value, seen=()):
+        """
+        :return: description of value which is the same in every process:
+        contents of containers and attributes of objects without their
+        own repr are described instead of repr with address in memory
+        and order of sets, which depends on hash seed;
+        """
+        if callable(value) and not isinstance(value, type):
+            return cls.describe_function(value, seen)
+        if isinstance(value, (list, tuple)):
+            return [cls.describe_value(item, seen) for item in value]
+        if isinstance(value, dict):
+            return [(cls.describe_value(key, seen),
+                     cls.describe_value(item, seen))
+                    for key, item in value.items()]
+        if isinstance(value, (set, frozenset)):
+            return sorted(repr(cls.describe_value(item, seen))
+                          for item in value)
+        if type(value).__repr__ is object.__repr__ and \
+                hasattr(value, '__dict__'):
+            name = '{}.{}'.format(type(value).__module__,
+                                  type(value).__qualname__)
+            if id(value) in seen:
+                return name
+            return name, cls.describe_value(vars(value),
+                                            seen + (id(value),))
+        return repr(value)
+
+    def path(self, index):
+        return os.path.join(self.directory, 'graph_{}.pkl'.format(index))
+
+    def save(self, index):
+        """
+        Save result of graph sorted_graphs[index] with its fingerprint.
+        :return: size of checkpoint in bytes;
+        """
+        if self.fingerprints[index] is None:
+            return 0
+        path = self.path(index)
+        with open(path + '.tmp', 'wb') as checkpoint:
+            pickle.dump(self.fingerprints[index], checkpoint,
+                        pickle.HIGHEST_PROTOCOL)
+            pickle.dump(self.sorted_graphs[index].result, checkpoint,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        return os.path.getsize(path)
+
+    def load(self, index):
+        """
+        Load result of graph sorted_graphs[index] if its checkpoint is
+        valid.
+        :return: True if result was loaded, False otherwise;
+        """
+        if self.fingerprints[index] is None:
+            return False
+        try:
+            with open(self.path(index), 'rb') as checkpoint:
+                if pickle.load(checkpoint) != self.fingerprints[index]:
+                    return False
+                self.sorted_graphs[index].result = pickle.load(checkpoint)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+        return True
+
+
 class BasicOperation(object):
     """
     Parent class for Map, Reduce, Sort, Fold and Join operations.
@@ -277,9 +1072,34 @@ class BasicOperation(object):
     compiling to connect nodes with each other.
     """
 
+    # attributes of operations which define their results
+    parameters = (
+        'mapper', 'folder', 'reducer', 'initial_state', 'keys_to_compare',
+        'keys_to_group_by', 'keys_to_rank_by', 'streaming', 'k', 'largest',
+        'key1', 'key2', 'strategy', 'column', 'error_rate', 'capacity',
+        'result_column', 'schema')
+
     def __init__(self):
         super().__init__()
 
+    def __repr__(self):
+        parameters = ['{}={}'.format(name, describe_value(getattr(self,
+                                                                 name)))
+                      for name in ('on', 'source') + self.parameters
+                      if getattr(self, name, None) is not None]
+        return '{}({})'.format(type(self).__name__, ', '.join(parameters))
+
+    def copy_parameters(self):
+        """
+        :return: copy of operation without state of previous runs
+        (iterators, tables, joined graph), e.g. to send it to another
+        process;
+        """
+        clone = copy.copy(self)
+        clone.__dict__ = {name: value for name, value in vars(self).items()
+                          if name in self.parameters}
+        return clone
+
     def set_iter_from_previous_node(self, previous_node_iter):
         """
         Takes iterator on a result from previous node.
@@ -296,11 +1116,16 @@ class Map(BasicOperation):
     rows for each input row.
     """
 
-    def __init__(self, mapper):
+    def __init__(self, mapper, schema=None):
         """
         :param mapper: generator object
+        :param schema (list of strings, default None): columns of rows
+        yielded by mapper. If schema is specified, rows are stored as
+        compact Record objects and mapper may yield tuples of values in
+        order of columns instead of dicts.
         """
         self.mapper = mapper
+        self.schema = schema
         super().__init__()
 
     def __iter__(self):
@@ -308,6 +1133,17 @@ class Map(BasicOperation):
         generator delegation to mapper generator
         :return: iterator object, result of mapper
         """
+        if self.schema is not None:
+            cls = record_type(self.schema)
+            new_record = partial(tuple.__new__, cls)
+            from_row = cls.from_row
+            for row in self.previous_node_iter:
+                for result in self.mapper(row):
+                    if result.__class__ is tuple:
+                        yield new_record(result)
+                    else:
+                        yield from_row(result)
+            return
         for row in self.previous_node_iter:
             yield from self.mapper(row)
 
@@ -326,15 +1162,19 @@ class Fold(BasicOperation):
         if initial_state is None:
             raise TypeError("please specify initial state as a dict")
         self.folder = folder
+        self.initial_state = initial_state
         self.state = initial_state
         super().__init__()
 
     def __iter__(self):
         """
         generator delegation to folder
+        Folder starts from a copy of initial state, so the graph might
+        be run many times.
         :return: list iterator (dict): row of table, result of folder
         generator;
         """
+        self.state = copy.deepcopy(self.initial_state)
         for row in self.previous_node_iter:
             self.state = (self.folder(self.state, row))
         yield self.state
@@ -357,8 +1197,13 @@ class Sort(BasicOperation):
     :attribute table (list of dicts): table to sort; comes from previous
     node by iterator;
     or as a list of dicts from Join;
+    :attribute algorithm (str): 'sort' or 'skip' (rows are passed as is,
+    chosen by planner, see ComputationalGraph.plan_graph);
     """
 
+    algorithm = 'sort'
+    algorithm_note = ''
+
     def __init__(self, key, table=None):
         """
         :param key: keys to compare rows by
@@ -373,15 +1218,21 @@ class Sort(BasicOperation):
         self.is_sorted = False
         super().__init__()
 
+    def set_iter_from_previous_node(self, previous_node_iter):
+        super().set_iter_from_previous_node(previous_node_iter)
+        self.is_sorted = False
+
     def __iter__(self):
         """
         Sort table once by keys and return an iterator or rows in table
         :return: iterator on result;
         """
+        if self.algorithm == 'skip':
+            yield from self.previous_node_iter
+            return
         if not self.is_sorted:
-            self.table = list(self.previous_node_iter)
-            self.table = sorted(self.table,
-                                key=itemgetter(*(self.keys_to_compare)))
+            self.table = sort_rows(list(self.previous_node_iter),
+                                   self.keys_to_compare)
             self.is_sorted = True
         for row in self.table:
             yield row
@@ -390,15 +1241,30 @@ class Sort(BasicOperation):
 class Reduce(BasicOperation):
     """
     Group rows in table by keys and put group to reducer
+
+    :attribute algorithm (str): 'sort' (groups are consecutive rows of
+    sorted table) or 'hash' (rows of unsorted table are grouped in dict
+    and groups are reduced in order of keys), chosen by planner (see
+    ComputationalGraph.plan_graph);
     """
 
-    def __init__(self, reducer, key):
+    algorithm = 'sort'
+    algorithm_note = ''
+
+    def __init__(self, reducer, key, streaming=False):
         """
         :param reducer: process rows with the same keys
         :param key: keys to group rows by
+        :param streaming: if True, reducer is called as
+        reducer(key, rows), where key is a dict with values of the group
+        keys and rows is a lazy iterator over the rows of the group.
+        Group is never stored in buffer, so memory per group is O(1)
+        for reducers which don't collect rows (e.g. count_rows,
+        sum_column, min_column, max_column, top_k_rows, first_row).
         :type reducer: generator object
         :type key: list of strings; e.g. if key = ['word'], than Reduce
         will group rows with the same value row['word']
+        :type streaming (default False): bool
 
         :attribute buffer: buffer to group rows with the same value by key
         :attribute previous_node (deafult None): we need it to start to
@@ -410,6 +1276,7 @@ class Reduce(BasicOperation):
         else:
             raise TypeError("key parameter to group by in reducer should"
                             " be a list")
+        self.streaming = streaming
         self.buffer = []
         self.previous_row = None
         super().__init__()
@@ -422,28 +1289,891 @@ class Reduce(BasicOperation):
         Note: to use Reduce operation effectively (O(n)) one should sort
         input table by the same set of keys
         """
-        for row in self.previous_node_iter:
-            if self.previous_row is not None:
-                flag = True
-                for key in self.keys_to_group_by:
-                    if row[key] != self.previous_row[key]:
-                        flag = False
-                if not flag:
-                    yield from self.reducer(self.buffer)
-                    self.buffer = []
+        if self.algorithm == 'hash':
+            yield from self.reduce_hash()
+            return
+        if self.streaming:
+            yield from self.reduce_streaming()
+            return
+        self.buffer = []
+        self.previous_row = None
+        first_row, rows = peek(self.previous_node_iter)
+        if first_row is None:  # empty table (e.g. partition) has no groups
+            return
+        get_key = key_getter(self.keys_to_group_by, first_row)
+        previous_key = None
+        for row in rows:
+            key = get_key(row)
+            if self.previous_row is not None and key != previous_key:
+                yield from self.reducer(self.buffer)
+                self.buffer = []
             self.buffer.append(row)
             self.previous_row = row
+            previous_key = key
         yield from self.reducer(self.buffer)  # to reduce last group
 
+    def reduce_hash(self):
+        """
+        Group rows in dict by keys and reduce groups in order of keys,
+        so result is the same as result of Sort and Reduce.
+        Rows with unhashable keys (e.g. lists) are sorted instead.
+        :return: iterator on rows, yielded by reducer for each group
+        """
+        first_row, rows = peek(self.previous_node_iter)
+        if first_row is None:
+            return
+        get_key = key_getter(self.keys_to_group_by, first_row)
+        rows = list(rows)
+        groups = {}
+        try:
+            for row in rows:
+                groups.setdefault(get_key(row), []).append(row)
+        except TypeError:
+            rows.sort(key=get_key)
+            self.algorithm = 'sort'
+            self.algorithm_note = '(keys are unhashable)'
+            self.previous_node_iter = iter(rows)
+            yield from self
+            return
+        for key_values in sorted(groups):
+            if self.streaming:
+                yield from self.reducer(
+                    dict(zip(self.keys_to_group_by, key_values)),
+                    iter(groups.pop(key_values)))
+            else:
+                yield from self.reducer(groups.pop(key_values))
+
+    def reduce_streaming(self):
+        """
+        Pass each group to reducer as a lazy iterator without buffering.
+        Rows of the group which reducer didn't consume are skipped.
+        :return: iterator on rows, yielded by reducer for each group
+        """
+        first_row, rows = peek(self.previous_node_iter)
+        get_key = key_getter(self.keys_to_group_by, first_row)
+        for key_values, group in groupby(rows, get_key):
+            yield from self.reducer(
+                dict(zip(self.keys_to_group_by, key_values)), group)
+
+
+def key_getter(keys, row=None):
+    """
+    Make function which returns tuple of row values by keys.
+    Unlike itemgetter, it returns tuple for one key too.
+    :param keys (list of strings);
+    :param row (dict or Record, default None): example of rows the
+    function will be applied to. Records have faster key getters;
+    :return: function row -> tuple
+    """
+    if isinstance(row, Record):
+        return row.key_getter(keys)
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda row: (row[key],)
+    return itemgetter(*keys)
+
+
+def sort_rows(rows, keys):
+    """
+    Sort rows by keys (stable sort).
+    If all rows are records of one class, their keys are taken from
+    tuples without Python function call for each row and records are
+    reordered by sorted keys.
+    :param rows (list of rows);
+    :param keys (list of strings);
+    :return: sorted list of rows;
+    """
+    if not rows:
+        return rows
+    if isinstance(rows[0], Record) and len(set(map(type, rows))) == 1:
+        values = rows[0].key_values(rows, keys)
+        return list(map(rows.__getitem__,
+                        sorted(range(len(rows)), key=values.__getitem__)))
+    rows.sort(key=key_getter(keys, rows[0]))
+    return rows
+
+
+def peek(rows):
+    """
+    :param rows (iterable of rows);
+    :return: (first row or None if there are no rows, iterator on all
+    rows);
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return None, rows
+    return first, chain((first,), rows)
+
+
+_tuple_getitem = tuple.__getitem__
+
+
+class Record(tuple):
+    """
+    Compact row: tuple of values with columns declared by schema.
+    Takes several times less memory than dict with the same columns.
+
+    Record supports read-only dict interface for mappers and reducers:
+    row['word'], keys(), values(), items(), get(), 'word' in row,
+    copy() and to_dict() (both return dict). Note that iteration over
+    record yields values, not keys (like tuple).
+
+    Record classes are created by record_type function, one class for
+    each list of columns.
+    """
+    __slots__ = ()
+    columns = ()
+    positions = {}
+    key_getters = {}
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        :param row (dict, tuple of values in order of columns or Record);
+        :return: record of this class;
+        """
+        if type(row) is cls:
+            return row
+        if type(row) is tuple:
+            return tuple.__new__(cls, row)
+        return tuple.__new__(cls, map(row.__getitem__, cls.columns))
+
+    @classmethod
+    def key_getter(cls, keys):
+        """
+        :param keys (list of strings);
+        :return: function record -> tuple of values by keys. If keys are
+        consecutive columns, the function is just a slice of tuple.
+        Other rows (e.g. dicts from Map without schema) are accessed by
+        keys;
+        """
+        keys = tuple(keys)
+        getter = cls.key_getters.get(keys)
+        if getter is None:
+            positions = [cls.positions[key] for key in keys]
+            start = positions[0]
+            if positions == list(range(start, start + len(positions))):
+                part = slice(start, start + len(positions))
+
+                def getter(row):
+                    if row.__class__ is cls:
+                        return _tuple_getitem(row, part)
+                    return tuple([row[key] for key in keys])
+            else:
+                def getter(row):
+                    if row.__class__ is cls:
+                        return tuple([_tuple_getitem(row, position)
+                                      for position in positions])
+                    return tuple([row[key] for key in keys])
+            cls.key_getters[keys] = getter
+        return getter
+
+    @classmethod
+    def key_values(cls, records, keys):
+        """
+        :param records (list of records of this class);
+        :param keys (list of strings);
+        :return: list of values of the key (for one key) or of tuples of
+        values of keys of records, taken without Python function call for
+        each record;
+        """
+        columns = [list(map(_tuple_getitem, records,
+                            repeat(cls.positions[key]))) for key in keys]
+        if len(columns) == 1:
+            return columns[0]
+        return list(zip(*columns))
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            return _tuple_getitem(self, self.positions[key])
+        return _tuple_getitem(self, key)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __repr__(self):
+        return 'Record({})'.format(', '.join(
+            '{}={!r}'.format(column, value) for column, value in self.items()))
+
+    def __reduce__(self):
+        return _rebuild_record, (self.columns, tuple(self))
+
+    def keys(self):
+        return self.columns
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self.columns, tuple(self))
+
+    def get(self, key, default=None):
+        position = self.positions.get(key)
+        if position is None:
+            return default
+        return _tuple_getitem(self, position)
+
+    def to_dict(self):
+        return dict(self.items())
+
+    copy = to_dict
+
+
+_record_types = {}
+
+
+def record_type(columns):
+    """
+    :param columns (list of strings): schema of rows;
+    :return: subclass of Record with these columns (the same class for
+    the same columns);
+    """
+    columns = tuple(columns)
+    cls = _record_types.get(columns)
+    if cls is None:
+        cls = type('Record', (Record,), {
+            '__slots__': (),
+            'columns': columns,
+            'positions': {column: index
+                          for index, column in enumerate(columns)},
+            'key_getters': {}
+        })
+        _record_types[columns] = cls
+    return cls
+
+
+def _rebuild_record(columns, values):
+    return tuple.__new__(record_type(columns), values)
+
+
+def count_rows(result_column='count'):
+    """
+    Streaming reducer: number of rows in group.
+    Example of code:
+        mrop.Reduce(mrop.count_rows('number'), key=['word'],
+                    streaming=True)
+    :param result_column (str): column for the number of rows;
+    :return: reducer for Reduce(..., streaming=True)
+    """
+    return partial(_count_rows, result_column)
+
+
+def sum_column(column, result_column=None):
+    """
+    Streaming reducer: sum of column values in group.
+    :param column (str): column to sum;
+    :param result_column (str, default column): column for the sum;
+    :return: reducer for Reduce(..., streaming=True)
+    """
+    return partial(_aggregate_column, sum, column, result_column)
+
+
+def min_column(column, result_column=None):
+    """
+    Streaming reducer: minimal column value in group.
+    :param column (str): column to take minimum of;
+    :param result_column (str, default column): column for the minimum;
+    :return: reducer for Reduce(..., streaming=True)
+    """
+    return partial(_aggregate_column, min, column, result_column)
+
+
+def max_column(column, result_column=None):
+    """
+    Streaming reducer: maximal column value in group.
+    :param column (str): column to take maximum of;
+    :param result_column (str, default column): column for the maximum;
+    :return: reducer for Reduce(..., streaming=True)
+    """
+    return partial(_aggregate_column, max, column, result_column)
+
+
+def top_k_rows(k, column):
+    """
+    Streaming reducer: k rows of group with the largest column values.
+    Keeps only k rows of group in memory (bounded heap).
+    :param k (int): number of rows to keep;
+    :param column (str): column to rank rows by;
+    :return: reducer for Reduce(..., streaming=True)
+    """
+    return partial(_top_k_rows, k, column)
+
+
+def first_row():
+    """
+    Streaming reducer: first row of group (e.g. to get unique rows).
+    :return: reducer for Reduce(..., streaming=True)
+    """
+    return _first_row
+
+
+# Streaming reducers are partials of module functions (not closures),
+# so they might be pickled and sent to worker processes.
+
+def _count_rows(result_column, key, rows):
+    counter = deque(enumerate(rows, 1), maxlen=1)
+    row = dict(key)
+    row[result_column] = counter[0][0] if counter else 0
+    yield row
+
+
+def _aggregate_column(aggregate, column, result_column, key, rows):
+    if result_column is None:
+        result_column = column
+    row = dict(key)
+    row[result_column] = aggregate(map(itemgetter(column), rows))
+    yield row
+
+
+def _top_k_rows(k, column, key, rows):
+    yield from heapq.nlargest(k, rows, key=itemgetter(column))
+
+
+def _first_row(key, rows):
+    yield next(rows)
+
+
+class TopK(BasicOperation):
+    """
+    Select k rows with the largest (or smallest) values by key in the
+    whole table or in each group of rows.
+
+    Keeps at most k rows of each group in a bounded heap, so it takes
+    O(n log k) time and O(k) memory per group instead of full Sort.
+    Input table doesn't need to be sorted. Rows with equal values by
+    key keep their input order.
+
+    For distributed runs TopK is computed in two steps: partial method
+    selects top k rows in each partition, merge method merges partial
+    results into the final one.
+    """
+
+    def __init__(self, k, key, group_by=None, largest=True):
+        """
+        :param k (int): number of rows to select (in each group);
+        :param key (list of strings): keys to rank rows by;
+        :param group_by (list of strings, default None): keys to group
+        rows by. If None, k rows are selected from the whole table;
+        :param largest (bool, default True): select rows with the
+        largest values if True, with the smallest values otherwise;
+
+        Example of code:
+            mrop.TopK(3, key=['tf-idf'], group_by=['word'])
+        """
+        if not isinstance(key, list):
+            raise TypeError("key parameter to rank rows by in TopK should"
+                            " be a list")
+        if group_by is not None and not isinstance(group_by, list):
+            raise TypeError("group_by parameter in TopK should be a list")
+        self.k = k
+        self.keys_to_rank_by = key
+        self.keys_to_group_by = group_by
+        self.largest = largest
+        super().__init__()
+
+    def __iter__(self):
+        """
+        :return: iterator on top rows; groups go in order of their first
+        appearance, rows of group go from the best to the worst;
+        """
+        yield from self.merge([self.partial(self.previous_node_iter)])
+
+    def partial(self, rows):
+        """
+        Select top k rows of each group from a part of the table.
+        :param rows (iterable of dicts): part of the table;
+        :return: list of rows (the same format as result of TopK);
+        """
+        return list(self.select(rows))
+
+    def merge(self, partials):
+        """
+        Merge partial results of TopK on parts of the table.
+        :param partials (list of lists of dicts): results of partial;
+        :return: iterator on top rows of the whole table;
+        """
+        return self.select(chain.from_iterable(partials))
+
+    def select(self, rows):
+        """
+        Keep k best rows of each group in a heap. The worst of kept rows
+        is on the top of the heap and is replaced by better rows.
+        :param rows (iterable of dicts);
+        :return: iterator on top rows;
+        """
+        if self.k <= 0:
+            return
+        first_row, rows = peek(rows)
+        get_rank = key_getter(self.keys_to_rank_by, first_row)
+        get_group = _group_getter(self.keys_to_group_by, first_row)
+        heaps = {}
+        for index, row in enumerate(rows):
+            if self.largest:
+                entry = ((get_rank(row), -index), row)
+            else:
+                entry = (_Inverted((get_rank(row), index)), row)
+            heap = heaps.setdefault(get_group(row), [])
+            if len(heap) < self.k:
+                heapq.heappush(heap, entry)
+            elif heap[0] < entry:
+                heapq.heapreplace(heap, entry)
+        for heap in heaps.values():
+            for entry in sorted(heap, reverse=True):
+                yield entry[1]
+
+
+class _Inverted(object):
+    """
+    Wrapper which inverts comparison of values (to keep the smallest
+    values in TopK heap).
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class ApproxDistinct(BasicOperation):
+    """
+    Approximate number of distinct values of column in the whole table
+    or in each group of rows (HyperLogLog).
+
+    Works in one pass over unsorted table with fixed memory per group.
+    Like TopK, it has partial and merge methods for distributed runs.
+    """
+
+    def __init__(self, column, key=None, error_rate=0.02,
+                 result_column=None):
+        """
+        :param column (str): column to count distinct values of;
+        :param key (list of strings, default None): keys to group rows
+        by. If None, Fold-like operation: one row for the whole table;
+        :param error_rate (float): relative standard error of estimate;
+        :param result_column (str, default 'distinct_<column>'): column
+        for the estimate;
+
+        Example of code (number of documents with each word):
+            mrop.ApproxDistinct('doc_id', key=['word'],
+                                result_column='docs_where_word_is_present')
+        """
+        if key is not None and not isinstance(key, list):
+            raise TypeError("key parameter in ApproxDistinct should be a"
+                            " list")
+        self.column = column
+        self.keys_to_group_by = key
+        self.error_rate = error_rate
+        if result_column is None:
+            result_column = 'distinct_{}'.format(column)
+        self.result_column = result_column
+        super().__init__()
+
+    def __iter__(self):
+        """
+        :return: iterator on rows with estimates; groups go in order of
+        their first appearance;
+        """
+        yield from self.merge([self.partial(self.previous_node_iter)])
+
+    def partial(self, rows):
+        """
+        :param rows (iterable of dicts): part of the table;
+        :return: dict {group key: HyperLogLog};
+        """
+        sketches = {}
+        first_row, rows = peek(rows)
+        get_group = _group_getter(self.keys_to_group_by, first_row)
+        for row in rows:
+            group = get_group(row)
+            sketch = sketches.get(group)
+            if sketch is None:
+                sketch = sketches[group] = HyperLogLog(self.error_rate)
+            sketch.add(row[self.column])
+        return sketches
+
+    def merge(self, partials):
+        """
+        :param partials (list of dicts): results of partial;
+        :return: iterator on rows with estimates;
+        """
+        sketches = _merge_sketches(partials)
+        if self.keys_to_group_by is None and not sketches:
+            sketches[()] = HyperLogLog(self.error_rate)
+        for group, sketch in sketches.items():
+            row = _group_row(self.keys_to_group_by, group)
+            row[self.result_column] = sketch.estimate()
+            yield row
+
+
+class HeavyHitters(BasicOperation):
+    """
+    Approximate k most frequent values of column in the whole table or
+    in each group of rows (Space-Saving algorithm).
+
+    Works in one pass over unsorted table with fixed memory per group.
+    Estimated frequency of value is not less than the real one and is
+    greater by at most error_rate * (number of rows in group).
+    Like TopK, it has partial and merge methods for distributed runs.
+    """
+
+    def __init__(self, column, k, key=None, error_rate=0.001,
+                 result_column='count'):
+        """
+        :param column (str): column to count values of;
+        :param k (int): number of most frequent values to yield;
+        :param key (list of strings, default None): keys to group rows
+        by. If None, values are counted in the whole table;
+        :param error_rate (float): bound of frequency error relative to
+        the number of rows; defines the number of counters;
+        :param result_column (str): column for estimated frequency;
+        """
+        if key is not None and not isinstance(key, list):
+            raise TypeError("key parameter in HeavyHitters should be a"
+                            " list")
+        self.column = column
+        self.k = k
+        self.keys_to_group_by = key
+        self.capacity = max(k, int(math.ceil(1 / error_rate)))
+        self.result_column = result_column
+        super().__init__()
+
+    def __iter__(self):
+        """
+        :return: iterator on rows {keys..., column, result_column};
+        groups go in order of their first appearance, values of group go
+        from the most frequent one;
+        """
+        yield from self.merge([self.partial(self.previous_node_iter)])
+
+    def partial(self, rows):
+        """
+        :param rows (iterable of dicts): part of the table;
+        :return: dict {group key: SpaceSaving};
+        """
+        summaries = {}
+        first_row, rows = peek(rows)
+        get_group = _group_getter(self.keys_to_group_by, first_row)
+        for row in rows:
+            group = get_group(row)
+            summary = summaries.get(group)
+            if summary is None:
+                summary = summaries[group] = SpaceSaving(self.capacity)
+            summary.add(row[self.column])
+        return summaries
+
+    def merge(self, partials):
+        """
+        :param partials (list of dicts): results of partial;
+        :return: iterator on rows with the most frequent values;
+        """
+        for group, summary in _merge_sketches(partials).items():
+            for value, count in summary.most_common(self.k):
+                row = _group_row(self.keys_to_group_by, group)
+                row[self.column] = value
+                row[self.result_column] = count
+                yield row
+
+
+def _group_getter(keys, row=None):
+    if keys is None:
+        return lambda row: ()
+    return key_getter(keys, row)
+
+
+def _group_row(keys, group):
+    if keys is None:
+        return {}
+    return dict(zip(keys, group))
+
+
+def _merge_sketches(partials):
+    merged = {}
+    for sketches in partials:
+        for group, sketch in sketches.items():
+            if group in merged:
+                merged[group] = merged[group].merge(sketch)
+            else:
+                merged[group] = sketch
+    return merged
+
+
+def _hash64(value):
+    """
+    64-bit hash of value which is the same in all processes (unlike
+    built-in hash of strings), so sketches are mergeable.
+    """
+    digest = blake2b(repr(value).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HyperLogLog(object):
+    """
+    Sketch to estimate the number of distinct values.
+    While there are few values, their hashes are kept in a set and the
+    number of them is exact. Then the sketch switches to dense
+    registers: 2 ** precision bytes, precision depends on error_rate.
+    """
+
+    def __init__(self, error_rate=0.02):
+        """
+        :param error_rate (float): relative standard error of estimate;
+        """
+        precision = int(math.ceil(math.log2((1.04 / error_rate) ** 2)))
+        self.precision = min(max(precision, 4), 18)
+        self.registers = None
+        self.hashes = set()
+
+    def sparse_limit(self):
+        # set of hashes takes about as much memory as registers
+        return (1 << self.precision) >> 5
+
+    def add(self, value):
+        hashed = _hash64(value)
+        if self.registers is not None:
+            self.add_hash(self.registers, hashed)
+            return
+        self.hashes.add(hashed)
+        if len(self.hashes) > self.sparse_limit():
+            self.registers = self.dense_registers()
+            self.hashes = None
+
+    def add_hash(self, registers, hashed):
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = hashed & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > registers[index]:
+            registers[index] = rank
+
+    def dense_registers(self):
+        """
+        :return: registers of sketch (new ones if sketch is sparse);
+        """
+        if self.registers is not None:
+            return self.registers
+        registers = bytearray(1 << self.precision)
+        for hashed in self.hashes:
+            self.add_hash(registers, hashed)
+        return registers
+
+    def estimate(self):
+        """
+        :return: estimated number of distinct added values (int);
+        """
+        if self.registers is None:
+            return len(self.hashes)
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(
+            self.registers.count(rank) * 2.0 ** -rank
+            for rank in range(max(self.registers) + 1))
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)  # linear counting
+        return int(round(estimate))
+
+    def merge(self, other):
+        """
+        :param other (HyperLogLog): sketch with the same precision;
+        :return: new sketch of union of values;
+        """
+        if self.precision != other.precision:
+            raise ValueError("can't merge HyperLogLog sketches with "
+                             "different precision")
+        merged = HyperLogLog.__new__(HyperLogLog)
+        merged.precision = self.precision
+        merged.registers = None
+        merged.hashes = None
+        if self.registers is None and other.registers is None:
+            merged.hashes = self.hashes | other.hashes
+            if len(merged.hashes) <= merged.sparse_limit():
+                return merged
+        merged.registers = bytearray(map(max, self.dense_registers(),
+                                         other.dense_registers()))
+        merged.hashes = None
+        return merged
+
+
+class CountMinSketch(object):
+    """
+    Sketch to estimate frequencies of values.
+    Estimate is not less than the real frequency and with probability
+    1 - delta is greater by at most epsilon * total.
+    Memory: ceil(e / epsilon) * ceil(ln(1 / delta)) counters.
+
+    Might be used as a state of Fold:
+        def count_words(state, row):
+            state['sketch'].add(row['word'])
+            return state
+
+        mrop.Fold(count_words, {'sketch': mrop.CountMinSketch()})
+    """
+
+    def __init__(self, epsilon=0.001, delta=0.01):
+        """
+        :param epsilon (float): error relative to total count;
+        :param delta (float): probability of bigger error;
+        """
+        self.width = int(math.ceil(math.e / epsilon))
+        self.depth = int(math.ceil(math.log(1 / delta)))
+        self.table = [[0] * self.width for _ in range(self.depth)]
+        self.total = 0
+
+    def _indices(self, value):
+        digest = blake2b(repr(value).encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:], 'big') | 1
+        return [(first + row * second) % self.width
+                for row in range(self.depth)]
+
+    def add(self, value, count=1):
+        for row, index in zip(self.table, self._indices(value)):
+            row[index] += count
+        self.total += count
+
+    def estimate(self, value):
+        """
+        :return: estimated frequency of value (int);
+        """
+        return min(row[index]
+                   for row, index in zip(self.table, self._indices(value)))
+
+    def merge(self, other):
+        """
+        :param other (CountMinSketch): sketch with the same width and
+        depth;
+        :return: new sketch of both tables;
+        """
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("can't merge CountMinSketch sketches with "
+                             "different width or depth")
+        merged = CountMinSketch.__new__(CountMinSketch)
+        merged.width, merged.depth = self.width, self.depth
+        merged.table = [[first + second for first, second in zip(*rows)]
+                        for rows in zip(self.table, other.table)]
+        merged.total = self.total + other.total
+        return merged
+
+
+class SpaceSaving(object):
+    """
+    Summary to find the most frequent values with fixed number of
+    counters (capacity). Counter of value is not less than its real
+    frequency and is greater by at most total / capacity.
+    The least frequent value is found in a heap of counters; entries of
+    changed counters are left in the heap and skipped (lazy deletion),
+    the heap is rebuilt when it is too big.
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity (int): number of counters;
+        """
+        self.capacity = capacity
+        self.counters = {}
+        self.heap = []
+        self.pushes = 0
+        self.total = 0
+
+    def add(self, value, count=1):
+        self.total += count
+        if value in self.counters:
+            self.counters[value] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[value] = count
+        else:
+            # replace the least frequent value
+            rarest_count, _, rarest = heapq.heappop(self.heap)
+            del self.counters[rarest]
+            self.counters[value] = rarest_count + count
+        self.push(value)
+
+    def push(self, value):
+        # entries are compared by counts and order of pushes, not values
+        self.pushes += 1
+        heapq.heappush(self.heap, (self.counters[value], self.pushes, value))
+        if len(self.heap) > 2 * self.capacity + 64:
+            self.rebuild_heap()
+        self.skip_stale_entries()
+
+    def rebuild_heap(self):
+        self.heap = [(count, index, value) for index, (value, count)
+                     in enumerate(self.counters.items())]
+        heapq.heapify(self.heap)
+        self.pushes = len(self.heap)
+
+    def skip_stale_entries(self):
+        while self.heap and \
+                self.counters.get(self.heap[0][2]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def min_count(self):
+        """
+        :return: upper bound of frequency of values without counter;
+        """
+        if len(self.counters) < self.capacity:
+            return 0
+        return self.heap[0][0]
+
+    def most_common(self, k):
+        """
+        :return: list of k pairs (value, count) with the largest counts;
+        """
+        return heapq.nlargest(k, self.counters.items(), key=itemgetter(1))
+
+    def merge(self, other):
+        """
+        :param other (SpaceSaving);
+        :return: new summary of both tables;
+        """
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        own_missing, other_missing = self.min_count(), other.min_count()
+        values = chain(self.counters, (value for value in other.counters
+                                       if value not in self.counters))
+        for value in values:
+            merged.counters[value] = (
+                self.counters.get(value, own_missing) +
+                other.counters.get(value, other_missing))
+        merged.counters = dict(merged.most_common(merged.capacity))
+        merged.rebuild_heap()
+        merged.total = self.total + other.total
+        return merged
+
 
 class Join(BasicOperation):
     """
     Analogue of JOIN operation in SQL
 
     Joins tables from two graphs according to strategy, selected by user
+
+    Algorithm of joining is chosen when both tables are ready (see
+    choose_algorithm). Table which defines order of result (left table
+    of left join, right table of right join) is called probe table, the
+    other one is build table:
+    - broadcast: outer join, each row of left table is joined with all
+    rows of right table (tables are sorted by keys, if they have keys);
+    - merge: both tables are sorted by keys, groups of rows with equal
+    keys are merged in one pass;
+    - hash: rows of build table are grouped by key in a dict, probe table
+    is read in order of keys (it is sorted first, if it isn't sorted and
+    isn't bigger than build table);
+    - grouped_hash: unsorted probe table is bigger than build table, so
+    it isn't sorted: rows of both tables are grouped by key in dicts and
+    only keys of the groups are sorted.
+    Result of joining is sorted by key and doesn't depend on algorithm.
+
+    :attribute algorithm (str): chosen algorithm;
+    :attribute algorithm_note (str): why the algorithm was chosen;
     """
 
-    def __init__(self, on, strategy, key=None):
+    strategies = ('outer', 'left', 'right')
+    algorithm = None
+    algorithm_note = ''
+
+    def __init__(self, on, strategy=None, key=None):
         """
         Set parameters of Join operation.
 
@@ -451,7 +2181,8 @@ class Join(BasicOperation):
         table to be joined with;
         :param key (['key1, 'key2']): keys which two rows will be compare by;
         :param strategy (str): strategy of joining (similar with SQL syntax);
-        Variants: outer (cross), left, right;
+        Variants: outer (cross), left, right; If None, outer for join
+        without key and left for join with key;
         """
         self.on = on
         if key is None:
@@ -463,12 +2194,23 @@ class Join(BasicOperation):
         else:
             self.key1 = key[0]
             self.key2 = key[1]
+        if strategy is None:
+            strategy = 'outer' if key is None else 'left'
+        if strategy not in self.strategies:
+            raise KeyError("please specify correct strategy of Join "
+                           " operation: outer, left, right")
+        if strategy != 'outer' and key is None:
+            raise TypeError("please specify key of {} Join".format(strategy))
         self.strategy = strategy
         self.result = []
         self.is_sorted = False
         self.was_called = False
         super().__init__()
 
+    def set_iter_from_previous_node(self, previous_node_iter):
+        super().set_iter_from_previous_node(previous_node_iter)
+        self.is_sorted = False
+
     def __iter__(self):
         """
         Generator delegation to another generator accordingly selected
@@ -476,25 +2218,69 @@ class Join(BasicOperation):
         :return: iterator object on resulting table;
         """
         if not self.is_sorted:
-            self.left_table = (
-                list(Sort(key=[self.key1],
-                          table=list(self.previous_node_iter)))
-            )
-            self.right_table = (list(Sort(key=[self.key2],
-                                          table=list(self.on.result))))
+            self.left_table = list(self.previous_node_iter)
+            self.right_table = list(self.on.result)
+            self.choose_algorithm()
             self.is_sorted = True
         if self.strategy == 'outer':
             yield from self.cross(self.left_table, self.right_table)
         elif self.strategy == "left":
-            yield from self.left()
-        elif self.strategy == "right":
-            self.key1, self.key2 = self.key2, self.key1
-            self.left_table, self.right_table = \
-                self.right_table, self.left_table
-            yield from self.left()
+            yield from self.join(self.left_table, self.right_table,
+                                 self.key1, self.key2)
         else:
-            raise KeyError("please specify correct strategy of Join "
-                           " operation: outer, left, right")
+            yield from self.join(self.right_table, self.left_table,
+                                 self.key2, self.key1)
+
+    def choose_algorithm(self):
+        """
+        Choose algorithm by sizes of tables and whether they are sorted
+        by keys (sortedness of right table is known from statistics of
+        joined graph), and sort tables if the algorithm needs it.
+        """
+        statistics = getattr(self.on, 'statistics', None)
+        left_sorted = self.key1 is None or \
+            is_sorted(self.left_table, [self.key1])
+        if self.key2 is None:
+            right_sorted = True
+        elif statistics is not None and \
+                statistics.rows == len(self.right_table) and \
+                statistics.is_sorted_by([self.key2]):
+            right_sorted = True
+        else:
+            right_sorted = is_sorted(self.right_table, [self.key2])
+        self.algorithm_note = "(left: {} rows{}, right: {} rows{})".format(
+            len(self.left_table), ', sorted' if left_sorted else '',
+            len(self.right_table), ', sorted' if right_sorted else '')
+
+        if self.strategy == 'outer':
+            self.algorithm = 'broadcast'
+            if not left_sorted:
+                self.left_table = list(Sort(key=[self.key1],
+                                            table=self.left_table))
+            if not right_sorted:
+                self.right_table = list(Sort(key=[self.key2],
+                                             table=self.right_table))
+            return
+        if left_sorted and right_sorted:
+            self.algorithm = 'merge'
+            return
+        if self.strategy == 'left':
+            probe_sorted, probe_rows, build_rows = \
+                left_sorted, len(self.left_table), len(self.right_table)
+        else:
+            probe_sorted, probe_rows, build_rows = \
+                right_sorted, len(self.right_table), len(self.left_table)
+        if not probe_sorted and build_rows < probe_rows:
+            self.algorithm = 'grouped_hash'
+            return
+        self.algorithm = 'hash'
+        # output goes in order of keys of the probed table
+        if self.strategy == 'left' and not left_sorted:
+            self.left_table = list(Sort(key=[self.key1],
+                                        table=self.left_table))
+        if self.strategy == 'right' and not right_sorted:
+            self.right_table = list(Sort(key=[self.key2],
+                                         table=self.right_table))
 
     def cross(self, left_group, right_group):
         """
@@ -511,23 +2297,97 @@ class Join(BasicOperation):
                 left_row_copy.update(right_row)
                 yield left_row_copy
 
-    def left(self):
+    def join(self, left_table, right_table, left_key, right_key):
+        """
+        Join groups of rows with equal keys by chosen algorithm.
+        :param left_table, right_table (lists of dicts): tables, left
+        table is sorted by left_key (unless algorithm is grouped_hash);
+        :param left_key, right_key (str): keys of tables;
+        :return: iterator on joined table;
         """
-        Implements LEFT OUTER JOIN (aka SQL)
+        if self.algorithm == 'merge':
+            yield from self.merge(left_table, right_table, left_key,
+                                  right_key)
+        elif self.algorithm == 'grouped_hash':
+            yield from self.grouped(left_table, right_table, left_key,
+                                    right_key)
+        else:
+            yield from self.left(left_table, right_table, left_key,
+                                 right_key)
 
-        This method groups rows in left table by key1, right table by key2
-        and performs FULL OUTER JOIN of these two groups.
+    def left(self, left_table, right_table, left_key, right_key):
+        """
+        Implements LEFT OUTER JOIN (aka SQL) by hash algorithm
+
+        This method groups rows in right table by right_key in a dict and
+        performs FULL OUTER JOIN of each group of left table with the
+        group of right table with the same key.
+        :param left_table (list of dicts): table sorted by left_key;
+        :param right_table (list of dicts);
+        :param left_key, right_key (str): keys of tables;
+        :return: iterator on joined table;
+        """
+        right_groups = {}
+        for row in right_table:
+            right_groups.setdefault(row[right_key], []).append(row)
+        for key, left_group in groupby(left_table, itemgetter(left_key)):
+            if key in right_groups:
+                yield from self.cross(list(left_group), right_groups[key])
+
+    def grouped(self, left_table, right_table, left_key, right_key):
+        """
+        Join unsorted left table with smaller right table without sorting
+        left table (grouped_hash algorithm): rows of both tables are
+        grouped by keys in dicts (only rows of left table with keys of
+        right table are kept) and groups are joined in order of keys.
+        :param left_table, right_table (lists of dicts);
+        :param left_key, right_key (str): keys of tables;
+        :return: iterator on joined table;
+        """
+        right_groups = {}
+        for row in right_table:
+            right_groups.setdefault(row[right_key], []).append(row)
+        left_groups = {}
+        for row in left_table:
+            key = row[left_key]
+            if key in right_groups:
+                left_groups.setdefault(key, []).append(row)
+        for key in sorted(left_groups):
+            yield from self.cross(left_groups.pop(key), right_groups[key])
+
+    def merge(self, left_table, right_table, left_key, right_key):
+        """
+        Join tables sorted by keys (merge algorithm).
+        :param left_table, right_table (lists of dicts): sorted tables;
+        :param left_key, right_key (str): keys of tables;
         :return: iterator on joined table;
         """
-        self.left_groups = {key: list(group) for key, group in
-                            groupby(self.left_table,
-                                    lambda item: item[self.key1])}
-        self.right_groups = {key: list(group) for key, group in
-                             groupby(self.right_table,
-                                     lambda item: item[self.key2])}
-        for key, left_group in self.left_groups.items():
-            if key in self.right_groups.keys():
-                yield from self.cross(left_group, self.right_groups[key])
+        right_groups = groupby(right_table, itemgetter(right_key))
+        right = next(right_groups, None)
+        for key, left_group in groupby(left_table, itemgetter(left_key)):
+            while right is not None and right[0] < key:
+                right = next(right_groups, None)
+            if right is None:
+                return
+            if right[0] == key:
+                right = (right[0], list(right[1]))
+                yield from self.cross(list(left_group), right[1])
+
+
+def is_sorted(rows, keys):
+    """
+    :param rows (list of rows);
+    :param keys (list of strings);
+    :return: True if rows are sorted by keys;
+    """
+    if len(rows) < 2:
+        return True
+    get_key = key_getter(keys, rows[0])
+    try:
+        return all(map(operator.le, map(get_key, rows),
+                       map(get_key, islice(rows, 1, None))))
+    except (TypeError, KeyError):
+        return False
 
 
 class InputDataNode(BasicOperation):
@@ -547,33 +2407,954 @@ class InputDataNode(BasicOperation):
     source of data for the new linear graph.
     """
 
-    def __init__(self, source):
+    def __init__(self, source, schema=None):
         """
         :param source (file object of ComputationalGraph object): source
         of data for InputDataNode (and the rest of linear graph);
         Source might be file or output of another graph. open file or
         another graph.
+        :param schema (list of strings, default None): if specified,
+        input rows are converted to Record objects with these columns;
         """
         self.source = source
+        self.schema = schema
         self.result = []
         super().__init__()
 
     def __iter__(self):
         """
         Provide iterator object on input data for the rest of linear graph.
+        Input file might be any iterable of json-lines or dicts.
         :return: iterator object on an input table;
         """
         if isinstance(self.source, str):
-            if not self.input_file.closed:
-                file_data = []
-                for line in self.input_file:
-                    if len(line) > 2:
-                        file_data.append(json.loads(str(line.strip())))
+            if self.source not in self.global_cache:
+                sample = self.global_cache.get('sample')
+                if sample is None:
+                    file_data = list(map(parse_row,
+                                         skip_empty_lines(self.input_file)))
+                else:
+                    file_data, scale = sample.select(self.input_file)
+                    self.global_cache['sample_scale'][self.source] = scale
 
                 self.global_cache[self.source] = file_data
-                self.input_file.close()
-            for row in self.global_cache[self.source]:
-                yield row
+                if hasattr(self.input_file, 'close'):
+                    self.input_file.close()
+            rows = self.global_cache[self.source]
         else:
-            for row in self.result:  # get result from another graph
-                yield row
+            rows = self.result  # get result from another graph
+        if self.schema is not None:
+            yield from map(record_type(self.schema).from_row, rows)
+        else:
+            yield from rows
+
+
+def _has_fixed_size(operation):
+    """
+    :param operation (BasicOperation's child object);
+    :return: True if number of rows operation produces doesn't depend on
+    number of its input rows (Fold, TopK, ApproxDistinct or HeavyHitters
+    without keys to group by);
+    """
+    if isinstance(operation, Fold):
+        return True
+    return isinstance(operation, (TopK, ApproxDistinct, HeavyHitters)) and \
+        operation.keys_to_group_by is None
+
+
+def describe_source(source):
+    """
+    :param source (str or ComputationalGraph object): source of graph;
+    :return: name of input or label of graph;
+    """
+    if isinstance(source, ComputationalGraph):
+        return getattr(source, 'label', getattr(source, 'name', 'graph'))
+    return str(source)
+
+
+def describe_value(value):
+    """
+    :return: short description of parameter of operation for its repr;
+    """
+    if isinstance(value, ComputationalGraph):
+        return describe_source(value)
+    if isinstance(value, partial):
+        return '{}({})'.format(describe_value(value.func),
+                               ', '.join(map(repr, value.args)))
+    if callable(value):
+        return getattr(value, '__name__', repr(value))
+    return repr(value)
+
+
+def _format_bytes(size):
+    if abs(size) < 1024:
+        return '{} B'.format(size)
+    if abs(size) < 1024 ** 2:
+        return '{:.1f} KiB'.format(size / 1024)
+    return '{:.1f} MiB'.format(size / 1024 ** 2)
+
+
+def _plan_details(node):
+    """
+    :param node (dict): graph or operation of plan (see explain);
+    :return: list of descriptions of its algorithm and costs;
+    """
+    details = []
+    if 'algorithm' in node:
+        details.append(' '.join(filter(None, [
+            'algorithm: {}'.format(node['algorithm'] or 'chosen at run'),
+            node['note']])))
+    if node.get('estimated_rows') is not None:
+        details.append('~{} rows'.format(node['estimated_rows']))
+    if node.get('rows') is not None:
+        details.append('rows: {}'.format(node['rows']))
+    if node.get('time') is not None:
+        details.append('time: {:.2f} ms'.format(node['time'] * 1000))
+    if node.get('peak_memory') is not None:
+        details.append('peak memory: {}'.format(
+            _format_bytes(node['peak_memory'])))
+    if node.get('spill'):
+        details.append('spill: {}'.format(_format_bytes(node['spill'])))
+    if node.get('restored'):
+        details.append('restored from checkpoint')
+    return details
+
+
+def _render_plan_text(plan):
+    lines = []
+    for graph in plan['graphs']:
+        details = ['source: {}'.format(graph['source'])]
+        if graph['dependencies']:
+            details.append('depends on: {}'.format(
+                ', '.join(graph['dependencies'])))
+        details.extend(_plan_details(graph))
+        if graph.get('sorted_by'):
+            details.append('sorted by: {}'.format(graph['sorted_by']))
+        lines.append('{} ({})'.format(graph['graph'], ', '.join(details)))
+        for node in graph['operations']:
+            details = _plan_details(node)
+            lines.append('    {}{}'.format(
+                node['description'],
+                ' [{}]'.format(', '.join(details)) if details else ''))
+    return '\n'.join(lines)
+
+
+def _render_plan_dot(plan):
+    def node_id(graph_index, operation_index):
+        return json.dumps('{}.{}'.format(graph_index, operation_index))
+
+    def last_node(graph):
+        return node_id(graph['index'], max(len(graph['operations']) - 1, 0))
+
+    graphs = plan['graphs']
+    lines = ['digraph plan {', '    node [shape=box];']
+    inputs = set()
+    for graph in graphs:
+        index = graph['index']
+        label = '\n'.join([graph['graph']] + _plan_details(graph))
+        lines.append('    subgraph cluster_{} {{'.format(index))
+        lines.append('        label={};'.format(json.dumps(label)))
+        nodes = graph['operations'] or [{'description': graph['graph']}]
+        for operation_index, node in enumerate(nodes):
+            label = '\n'.join([node['description']] + _plan_details(node))
+            lines.append('        {} [label={}];'.format(
+                node_id(index, operation_index), json.dumps(label)))
+        lines.append('    }')
+        for operation_index in range(1, len(nodes)):
+            lines.append('    {} -> {};'.format(
+                node_id(index, operation_index - 1),
+                node_id(index, operation_index)))
+        if graph['source_index'] is None:
+            source = json.dumps('input ' + graph['source'])
+            if source not in inputs:
+                inputs.add(source)
+                lines.append('    {} [shape=ellipse, label={}];'.format(
+                    source, json.dumps(graph['source'])))
+        else:
+            source = last_node(graphs[graph['source_index']])
+        lines.append('    {} -> {};'.format(source, node_id(index, 0)))
+        for operation_index, node in enumerate(graph['operations']):
+            if 'on_index' in node:
+                lines.append('    {} -> {} [style=dashed];'.format(
+                    last_node(graphs[node['on_index']]),
+                    node_id(index, operation_index)))
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def skip_empty_lines(lines):
+    """
+    :param lines (iterable of str or dicts): input file or rows;
+    :return: iterator on lines except empty ones;
+    """
+    return (line for line in lines
+            if not isinstance(line, str) or len(line) > 2)
+
+
+def parse_row(line):
+    """
+    :param line (str or dict): json-line of input file or row;
+    :return: row (dict);
+    """
+    if isinstance(line, str):
+        return json.loads(str(line.strip()))
+    return line
+
+
+class Sample(object):
+    """
+    Deterministic sample of input files for preview runs of graphs:
+        graph.run(main_input=open('text_corpus.txt', 'r'),
+                  save_result=open('preview.txt', 'w'),
+                  sample=mrop.Sample(fraction=0.01))
+
+    Sample is applied in InputDataNode when input file is read, so all
+    graphs get sampled data. Variants:
+    - Sample(first=n): first n rows of each input file;
+    - Sample(fraction=f, seed=s): each row is taken with probability f
+    (the same rows for the same seed);
+    - Sample(fraction=f, key=['doc_id']): rows are taken by hash of
+    values of key, so rows with the same key are taken from all input
+    files together and joins by this key stay consistent.
+    """
+
+    def __init__(self, fraction=None, first=None, key=None, seed=0):
+        """
+        :param fraction (float, 0 < fraction <= 1): part of rows to take;
+        :param first (int): number of rows to take from the beginning;
+        :param key (list of strings): keys to sample rows by hash of;
+        :param seed (int): seed of sampling by fraction;
+        """
+        if (fraction is None) == (first is None):
+            raise TypeError("please specify either fraction or first "
+                            "parameter of Sample")
+        if fraction is not None and not 0 < fraction <= 1:
+            raise ValueError("fraction of Sample should be in (0, 1]")
+        if key is not None and (fraction is None or
+                                not isinstance(key, list)):
+            raise TypeError("key parameter of Sample should be a list and "
+                            "is used only with fraction")
+        self.fraction = fraction
+        self.first = first
+        self.key = key
+        self.seed = seed
+
+    def __repr__(self):
+        if self.first is not None:
+            return "Sample(first={})".format(self.first)
+        if self.key is not None:
+            return "Sample(fraction={}, key={})".format(self.fraction,
+                                                        self.key)
+        return "Sample(fraction={}, seed={})".format(self.fraction,
+                                                     self.seed)
+
+    def select(self, lines):
+        """
+        Take sample of rows from lines of input file.
+        :param lines (iterable of str or dicts): json-lines of input
+        file or rows;
+        :return: (list of dicts, float): sampled rows and scale (number
+        of rows in file divided by number of sampled rows);
+        """
+        lines = skip_empty_lines(lines)
+        rows = []
+        total = 0
+        if self.first is not None:
+            for line in islice(lines, self.first):
+                rows.append(parse_row(line))
+            # the rest of file is only counted, not parsed
+            total = len(rows) + sum(1 for _ in lines)
+        elif self.key is None:
+            generator = random.Random(self.seed)
+            for line in lines:
+                total += 1
+                if generator.random() < self.fraction:
+                    rows.append(parse_row(line))
+        else:
+            threshold = self.fraction * 2 ** 64
+            get_key = key_getter(self.key)
+            for line in lines:
+                total += 1
+                row = parse_row(line)
+                if _hash64(get_key(row)) < threshold:
+                    rows.append(row)
+        if not rows:
+            return rows, 1.0
+        return rows, total / len(rows)
+
+
+class Window(object):
+    """
+    Windows of unbounded input for streaming run of graph (see
+    ComputationalGraph.run_stream):
+        for start, end, rows in graph.run_stream(
+                mrop.Window(size=60, step=10, column='time'),
+                main_input=mrop.follow(open('events.txt', 'r'))):
+            ...
+
+    Variants:
+    - Window(size=n): tumbling windows of n consecutive rows;
+    - Window(size=n, step=m): sliding windows of n rows, a new window
+    starts every m rows;
+    - Window(size=t, step=s, column='time'): windows [start, start + t)
+    by timestamp column, starts are multiples of s (tumbling if step is
+    None).
+    Window by count is emitted when its last row comes, window by
+    timestamp is emitted when a row with timestamp after the window
+    comes (or input ends). Timestamps should grow: rows with timestamps
+    before the first open window are late, they are dropped and counted
+    in late_rows. Only rows of open windows are kept in memory.
+    """
+
+    def __init__(self, size, step=None, column=None):
+        """
+        :param size (number): number of rows or duration of window;
+        :param step (number, default None): distance between starts of
+        sliding windows, size by default (tumbling windows);
+        :param column (str, default None): timestamp column of windows
+        by time, None for windows by count;
+        """
+        if step is None:
+            step = size
+        if not 0 < step <= size:
+            raise ValueError("size and step of Window should be positive "
+                             "and step shouldn't be greater than size")
+        self.size = size
+        self.step = step
+        self.column = column
+        self.late_rows = 0
+
+    def __repr__(self):
+        return "Window(size={}, step={}, column={!r})".format(
+            self.size, self.step, self.column)
+
+    def first_start(self, point):
+        """
+        :param point (number): position or timestamp of row;
+        :return: start of the first window with the point;
+        """
+        start = (point - self.size) // self.step * self.step + self.step
+        if self.column is None:
+            return max(start, 0)
+        return start
+
+    def split(self, rows):
+        """
+        :param rows (iterable of rows): possibly unbounded input;
+        :return: iterator on windows (start, end, list of rows);
+        """
+        self.late_rows = 0
+        buffer = deque()
+        start = lowest = None
+        for position, row in enumerate(rows):
+            point = position if self.column is None else row[self.column]
+            if start is None:
+                start = self.first_start(point)
+            if point < start:
+                self.late_rows += 1
+                continue
+            buffer.append((point, row))
+            if lowest is None or point < lowest:
+                lowest = point
+            # next row of window by count has the next position
+            watermark = point + 1 if self.column is None else point
+            if watermark >= start + self.size:
+                buffer, start, lowest = yield from self.close(
+                    buffer, start, lowest, watermark)
+        if buffer:
+            yield from self.close(buffer, start, lowest, math.inf)
+
+    def close(self, buffer, start, lowest, watermark):
+        """
+        Yield windows which end before watermark and aren't empty.
+        :param buffer (deque of tuples): points and rows of open windows
+        in order of arrival (and of points for windows by count);
+        :param start (number): start of the first open window;
+        :param lowest (number): the lowest point in buffer;
+        :param watermark (number): no rows before it will come;
+        :return: buffer, start of open windows and the lowest point;
+        """
+        while buffer:
+            start = max(start, self.first_start(lowest))
+            end = start + self.size
+            if end > watermark:
+                break
+            yield start, end, [row for point, row in buffer if point < end]
+            start += self.step
+            if lowest >= start:
+                continue
+            if self.column is None:
+                while buffer and buffer[0][0] < start:
+                    buffer.popleft()
+                lowest = buffer[0][0] if buffer else None
+            else:
+                buffer = deque(item for item in buffer if item[0] >= start)
+                lowest = min(point for point, _ in buffer) if buffer \
+                    else None
+        return buffer, start, lowest
+
+
+def follow(input_file, poll_interval=1.0):
+    """
+    Follow file which is being written (like tail -f): iterate over its
+    lines and wait for new lines at the end. Iterator never ends.
+    :param input_file (file object);
+    :param poll_interval (float): seconds to wait for new lines;
+    :return: iterator on lines;
+    """
+    pending = ''
+    while True:
+        line = input_file.readline()
+        if not line:
+            time.sleep(poll_interval)
+            continue
+        pending += line
+        if pending.endswith('\n'):  # line might be written partially
+            yield pending
+            pending = ''
+
+
+class LocalCluster(object):
+    """
+    Run graphs on several worker processes on one machine:
+        graph.run(main_input=open('text_corpus.txt', 'r'),
+                  save_result=open('output.txt', 'w'),
+                  cluster=mrop.LocalCluster(workers=4))
+
+    Coordinator (this object, in the process of run) reads input files,
+    compiles graphs to plans (operations without state) and ships the
+    plans to workers. Then it drives workers through operations of each
+    linear graph in topological order. Each worker keeps one partition
+    of each table and processes it with the same operations as a
+    single process run:
+    - Map works on partitions independently;
+    - Sort range-partitions rows by its first key (boundaries are taken
+    from a sample of keys), so concatenation of sorted partitions is
+    sorted;
+    - Reduce works on partitions independently if rows are already
+    partitioned by its keys (e.g. after Sort by them). Otherwise rows
+    which are sorted by its keys are range-partitioned by its first key,
+    and unsorted rows are collected on the first worker, because Reduce
+    groups only consecutive rows of unsorted table;
+    - Join partitions both tables by ranges of join key with the same
+    boundaries (outer join sends joined table to all workers);
+    - Fold collects rows on the first worker;
+    - TopK, ApproxDistinct and HeavyHitters compute partial results on
+    each worker and merge them on the first worker.
+    So the result is the same as result of a single process run.
+
+    Workers talk over local sockets: each worker runs a shuffle service
+    (thread with socket listener) which receives rows from other
+    workers, and sends rows of its partition directly to other workers.
+
+    Recovery: after each linear graph is computed, workers save their
+    partitions of its result to spill directory. If a worker process
+    dies, all workers are restarted, load partitions of computed graphs
+    and the current graph is computed again (up to max_retries times).
+    Errors in user functions are not retried.
+
+    Number of partitions for Sort, Reduce and Join is chosen by number of
+    rows of table (workers report it after each operation): small tables
+    are not spread over all workers, e.g. table with less rows than
+    rows_per_partition is processed by the first worker.
+
+    NOTE: functions of operations are sent to workers by pickle, so
+    they should be defined on the top level of a module.
+    """
+
+    def __init__(self, workers=2, max_retries=2, spill_dir=None,
+                 rows_per_partition=10000):
+        """
+        :param workers (int): number of worker processes;
+        :param max_retries (int): how many times to restart workers
+        after failures;
+        :param spill_dir (str, default None): directory for partitions
+        of computed graphs. If None, temporary directory is used and
+        removed after run;
+        :param rows_per_partition (int): minimal number of rows in one
+        partition of shuffled table;
+        """
+        self.workers = workers
+        self.rows_per_partition = rows_per_partition
+        self.max_retries = max_retries
+        self.spill_dir = spill_dir
+        self.processes = []
+        self.connections = []
+
+    def run_graphs(self, sorted_graphs, global_cache, input_files):
+        """
+        Compute graphs in topological order on workers and put result of
+        the final (last) graph to its result attribute.
+
+        :param sorted_graphs (list of ComputationalGraph objects);
+        :param global_cache (dict): global cache of run;
+        :param input_files (dict): kwargs of run with input files;
+        """
+        self.verbose = global_cache['verbose']
+        self.plans = [self.compile(graph, sorted_graphs)
+                      for graph in sorted_graphs]
+        self.inputs = {}
+        for graph in sorted_graphs:
+            if isinstance(graph.source, str) and \
+                    graph.source not in self.inputs:
+                node = InputDataNode(graph.source)
+                node.input_file = input_files[graph.source]
+                node.global_cache = global_cache
+                self.inputs[graph.source] = list(node)
+        self.partitioning = {}
+        self.shuffles = 0
+        spill_dir = self.spill_dir
+        if spill_dir is None:
+            spill_dir = tempfile.mkdtemp(prefix='mrop_cluster_')
+        else:
+            os.makedirs(spill_dir, exist_ok=True)
+        failures = 0
+        computed = []
+        try:
+            self.start(spill_dir)
+            while len(computed) < len(sorted_graphs):
+                index = len(computed)
+                try:
+                    self.run_graph(index)
+                    sorted_graphs[index].statistics = Statistics(self.rows)
+                    if index == len(sorted_graphs) - 1:
+                        partitions = self.command_all('collect',
+                                                      ('graph', index))
+                        sorted_graphs[index].result = \
+                            list(chain.from_iterable(partitions))
+                except _WorkerFailure as failure:
+                    failures += 1
+                    if failures > self.max_retries:
+                        raise RuntimeError("worker {} of LocalCluster "
+                                           "failed, no retries left".
+                                           format(failure.worker))
+                    if self.verbose:
+                        print("worker {} failed, restarting workers".
+                              format(failure.worker))
+                    self.stop()
+                    self.start(spill_dir)
+                    for computed_index in computed:
+                        self.command_all('restore', computed_index)
+                    continue
+                computed.append(index)
+        finally:
+            self.stop()
+            if self.spill_dir is None:
+                shutil.rmtree(spill_dir, ignore_errors=True)
+
+    @staticmethod
+    def compile(graph, sorted_graphs):
+        """
+        :return: plan of graph (dict): source (('input', name) or
+        ('graph', index)), schema, operations (copies without state) and
+        join_on (index of joined graph for each Join);
+        """
+        if isinstance(graph.source, ComputationalGraph):
+            source = ('graph', sorted_graphs.index(graph.source))
+        else:
+            source = ('input', graph.source)
+        operations = [operation for operation in graph.list_of_operations
+                      if not isinstance(operation, InputDataNode)]
+        return {
+            'source': source,
+            'schema': graph.schema,
+            'operations': [operation.copy_parameters()
+                           for operation in operations],
+            'join_on': {index: sorted_graphs.index(operation.on)
+                        for index, operation in enumerate(operations)
+                        if isinstance(operation, Join)}
+        }
+
+    def start(self, spill_dir):
+        """
+        Start worker processes, connect them with each other and send
+        plans to them.
+        """
+        context = multiprocessing.get_context('fork')
+        authkey = os.urandom(16)
+        listener = Listener(('127.0.0.1', 0), authkey=authkey)
+        self.processes = [
+            context.Process(target=_run_cluster_worker,
+                            args=(index, listener.address, authkey),
+                            daemon=True)
+            for index in range(self.workers)]
+        for process in self.processes:
+            process.start()
+        self.connections = [None] * self.workers
+        addresses = [None] * self.workers
+        for _ in range(self.workers):
+            connection = listener.accept()
+            index, address = connection.recv()
+            self.connections[index] = connection
+            addresses[index] = address
+        listener.close()
+        self.distributed_inputs = set()
+        self.command_all('plan', self.plans, addresses, spill_dir)
+
+    def stop(self):
+        for connection in self.connections:
+            try:
+                connection.send(('stop',))
+                connection.close()
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():  # e.g. it waits for a failed worker
+                process.terminate()
+                process.join()
+        self.processes = []
+        self.connections = []
+
+    def command(self, commands):
+        """
+        Send commands to workers and wait for their replies.
+        :param commands (list of tuples): command for each worker;
+        :return: list of results of commands;
+        """
+        for index, (connection, command) in \
+                enumerate(zip(self.connections, commands)):
+            try:
+                connection.send(command)
+            except OSError:
+                raise _WorkerFailure(index)
+        results = [None] * self.workers
+        pending = dict(enumerate(self.connections))
+        while pending:
+            for connection in wait(list(pending.values()), timeout=1):
+                index = self.connections.index(connection)
+                try:
+                    status, result = connection.recv()
+                except (EOFError, OSError):
+                    raise _WorkerFailure(index)
+                if status == 'error':
+                    raise RuntimeError("error on worker {}:\n{}".
+                                       format(index, result))
+                results[index] = result
+                del pending[index]
+            for index in pending:
+                if not self.processes[index].is_alive():
+                    raise _WorkerFailure(index)
+        return results
+
+    def command_all(self, *command):
+        return self.command([command] * self.workers)
+
+    def shuffle(self, table, target, partitioner):
+        """
+        Partition rows of table on all workers by partitioner and put
+        them to target table.
+        :param table, target (tuples): names of tables on workers;
+        :param partitioner (tuple): ('single',), ('broadcast',) or
+        ('range', [key], boundaries);
+        """
+        self.shuffles += 1
+        self.command_all('shuffle', table, target, partitioner,
+                         self.shuffles)
+
+    def partitions(self):
+        """
+        :return: number of partitions for current table by its number of
+        rows;
+        """
+        partitions = min(self.workers,
+                         max(1, -(-self.rows // self.rows_per_partition)))
+        if self.verbose:
+            print("{} partitions for {} rows".format(partitions, self.rows))
+        return partitions
+
+    def is_sorted(self, table, keys):
+        """
+        :return: True if concatenation of partitions of table is sorted
+        by keys;
+        """
+        ranges = [key_range for key_range in
+                  self.command_all('key_range', table, keys)
+                  if key_range is not None]
+        if not all(ordered for ordered, _, _ in ranges):
+            return False
+        try:
+            return all(previous[2] <= following[1]
+                       for previous, following in zip(ranges, ranges[1:]))
+        except TypeError:
+            return False
+
+    def range_partition(self, table, key):
+        """
+        Range-partition table by key with boundaries taken from a sample
+        of keys of all partitions.
+        :return: partitioner;
+        """
+        partitions = self.partitions()
+        samples = []
+        if partitions > 1:
+            samples = sorted(chain.from_iterable(
+                self.command_all('sample_keys', table, key)))
+        boundaries = [samples[len(samples) * part // partitions]
+                      for part in range(1, partitions)] if samples else []
+        partitioner = ('range', [key], boundaries)
+        self.shuffle(table, table, partitioner)
+        return partitioner
+
+    def run_graph(self, index):
+        """
+        Compute graph sorted_graphs[index] on workers. Partitioning of
+        its result is kept in partitioning dict (None if rows are
+        partitioned arbitrarily).
+        """
+        plan = self.plans[index]
+        kind, source = plan['source']
+        if kind == 'input':
+            if source not in self.distributed_inputs:
+                rows = self.inputs[source]
+                size = -(-len(rows) // self.workers)
+                self.command([('put_input', source,
+                               rows[part * size:(part + 1) * size])
+                              for part in range(self.workers)])
+                self.distributed_inputs.add(source)
+            partitioning = None
+        else:
+            partitioning = self.partitioning[source]
+        self.rows = sum(self.command_all('start', index, plan['source']))
+        for operation_index, operation in enumerate(plan['operations']):
+            partitioning = self.run_operation(index, operation_index,
+                                              operation, partitioning)
+        self.partitioning[index] = partitioning
+        self.command_all('persist', index)
+
+    def run_operation(self, index, operation_index, operation, partitioning):
+        """
+        Run one operation of graph on workers with shuffles it needs.
+        :return: partitioning of result of operation;
+        """
+        table = ('graph', index)
+        single = ('single',)
+        if isinstance(operation, Sort):
+            key = operation.keys_to_compare[0]
+            if partitioning != single and (
+                    partitioning is None or partitioning[0] != 'range' or
+                    partitioning[1] != [key]):
+                partitioning = self.range_partition(table, key)
+        elif isinstance(operation, Reduce):
+            keys = operation.keys_to_group_by
+            if partitioning != single and (
+                    partitioning is None or
+                    not set(partitioning[1]) <= set(keys)):
+                if self.is_sorted(table, keys):
+                    # range shuffle keeps order of rows
+                    partitioning = self.range_partition(table, keys[0])
+                else:
+                    self.shuffle(table, table, single)
+                    partitioning = single
+        elif isinstance(operation, Join):
+            partitioning = self.prepare_join(index, operation_index,
+                                             operation, partitioning)
+        elif hasattr(operation, 'partial'):
+            self.rows = sum(self.command_all('partial', index,
+                                             operation_index,
+                                             self.shuffles + 1))
+            self.shuffles += 1
+            return single
+        elif isinstance(operation, Fold):
+            if partitioning != single:
+                self.shuffle(table, table, single)
+            partitioning = single
+        else:
+            partitioning = None  # Map might change any column
+        self.rows = sum(self.command_all('run', index, operation_index))
+        return partitioning
+
+    def prepare_join(self, index, operation_index, operation, partitioning):
+        """
+        Partition left table and send joined table to workers, so each
+        worker can join its partitions.
+        :return: partitioning of joined table;
+        """
+        table = ('graph', index)
+        joined = ('graph', self.plans[index]['join_on'][operation_index])
+        side = ('join', index, operation_index)
+        key = operation.key1
+        if partitioning != ('single',) and key is not None and (
+                partitioning is None or partitioning[0] != 'range' or
+                partitioning[1] != [key]):
+            partitioning = self.range_partition(table, key)
+        if partitioning == ('single',):
+            self.shuffle(joined, side, partitioning)
+        elif operation.strategy == 'outer' or key is None:
+            self.shuffle(joined, side, ('broadcast',))
+        else:
+            self.shuffle(joined, side, ('range', [operation.key2],
+                                        partitioning[2]))
+        return partitioning
+
+
+class _WorkerFailure(Exception):
+    def __init__(self, worker):
+        super().__init__(worker)
+        self.worker = worker
+
+
+class _PartitionSource(object):
+    """
+    Joined graph for Join on worker: result is a partition of table.
+    """
+
+    def __init__(self, result):
+        self.result = result
+
+
+def _run_cluster_worker(index, coordinator_address, authkey):
+    worker = _ClusterWorker(index, authkey)
+    control = Client(coordinator_address, authkey=authkey)
+    control.send((index, worker.listener.address))
+    worker.serve(control)
+
+
+class _ClusterWorker(object):
+    """
+    Worker process of LocalCluster. Executes commands of coordinator on
+    its partitions of tables (do_* methods).
+    """
+
+    def __init__(self, index, authkey):
+        self.index = index
+        self.authkey = authkey
+        self.tables = {}
+        self.inbox = {}
+        self.condition = threading.Condition()
+        self.listener = Listener(('127.0.0.1', 0), authkey=authkey)
+        threading.Thread(target=self.receive, daemon=True).start()
+
+    def serve(self, control):
+        while True:
+            command = control.recv()
+            if command[0] == 'stop':
+                return
+            try:
+                result = getattr(self, 'do_' + command[0])(*command[1:])
+            except Exception:
+                control.send(('error', traceback.format_exc()))
+            else:
+                control.send(('ok', result))
+
+    def receive(self):
+        """
+        Shuffle service: receive rows sent by other workers.
+        """
+        while True:
+            with self.listener.accept() as connection:
+                shuffle_id, source, rows = connection.recv()
+            with self.condition:
+                self.inbox.setdefault(shuffle_id, {})[source] = rows
+                self.condition.notify_all()
+
+    def exchange(self, shuffle_id, buckets):
+        """
+        Send buckets[i] to worker i and receive buckets of all workers.
+        :return: list of received buckets in order of workers;
+        """
+        for peer, bucket in enumerate(buckets):
+            if peer == self.index:
+                with self.condition:
+                    self.inbox.setdefault(shuffle_id, {})[peer] = bucket
+            else:
+                with Client(self.peers[peer],
+                            authkey=self.authkey) as connection:
+                    connection.send((shuffle_id, self.index, bucket))
+        with self.condition:
+            self.condition.wait_for(
+                lambda: len(self.inbox.get(shuffle_id, ())) ==
+                len(self.peers))
+            received = self.inbox.pop(shuffle_id)
+        return [received[peer] for peer in range(len(self.peers))]
+
+    def operation(self, index, operation_index):
+        return self.plans[index]['operations'][operation_index]. \
+            copy_parameters()
+
+    def do_plan(self, plans, peers, spill_dir):
+        self.plans = plans
+        self.peers = peers
+        self.spill_dir = spill_dir
+
+    def do_put_input(self, name, rows):
+        self.tables[('input', name)] = rows
+
+    def do_start(self, index, source):
+        rows = self.tables[source]
+        schema = self.plans[index]['schema']
+        if schema is not None:
+            rows = map(record_type(schema).from_row, rows)
+        self.tables[('graph', index)] = list(rows)
+        return len(self.tables[('graph', index)])
+
+    def do_run(self, index, operation_index):
+        operation = self.operation(index, operation_index)
+        if isinstance(operation, Join):
+            operation.on = _PartitionSource(
+                self.tables.pop(('join', index, operation_index)))
+        rows = self.tables[('graph', index)]
+        if isinstance(operation, Fold) and self.index != 0:
+            rows = None  # Fold runs on the first worker only
+        else:
+            operation.set_iter_from_previous_node(iter(rows))
+            rows = list(operation)
+        self.tables[('graph', index)] = rows or []
+        return len(self.tables[('graph', index)])
+
+    def do_partial(self, index, operation_index, shuffle_id):
+        operation = self.operation(index, operation_index)
+        partial = operation.partial(self.tables[('graph', index)])
+        buckets = [[] for _ in self.peers]
+        buckets[0].append(partial)
+        partials = list(chain.from_iterable(self.exchange(shuffle_id,
+                                                          buckets)))
+        rows = []
+        if self.index == 0:
+            rows = list(operation.merge(partials))
+        self.tables[('graph', index)] = rows
+        return len(rows)
+
+    def do_key_range(self, table, keys):
+        rows = self.tables[table]
+        if not rows:
+            return None
+        get_key = key_getter(keys, rows[0])
+        return is_sorted(rows, keys), get_key(rows[0]), get_key(rows[-1])
+
+    def do_sample_keys(self, table, key):
+        values = sorted(row[key] for row in self.tables[table])
+        return values[::max(1, len(values) // 64)]
+
+    def do_shuffle(self, table, target, partitioner, shuffle_id):
+        rows = self.tables[table]
+        buckets = [[] for _ in self.peers]
+        if partitioner[0] == 'single':
+            buckets[0] = rows
+        elif partitioner[0] == 'broadcast':
+            buckets = [rows] * len(self.peers)
+        else:
+            key, boundaries = partitioner[1][0], partitioner[2]
+            for row in rows:
+                buckets[bisect.bisect_right(boundaries, row[key])].append(
+                    row)
+        self.tables[target] = list(chain.from_iterable(
+            self.exchange(shuffle_id, buckets)))
+
+    def partition_path(self, index):
+        return os.path.join(self.spill_dir, 'graph_{}_part_{}.pkl'.format(
+            index, self.index))
+
+    def do_persist(self, index):
+        path = self.partition_path(index)
+        with open(path + '.tmp', 'wb') as partition:
+            pickle.dump(self.tables[('graph', index)], partition,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def do_restore(self, index):
+        with open(self.partition_path(index), 'rb') as partition:
+            self.tables[('graph', index)] = pickle.load(partition)
+
+    def do_collect(self, table):
+        return self.tables[table]
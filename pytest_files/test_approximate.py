@@ -0,0 +1,76 @@
+import sys
+sys.path.append("..")
+import mrop
+
+
+table = [{'word': 'word_{}'.format(index % 50), 'doc_id': index % 1000}
+         for index in range(5000)]
+
+
+def run(operation, rows):
+    operation.previous_node_iter = iter(rows)
+    return list(operation)
+
+
+def test_approx_distinct():
+    result = run(mrop.ApproxDistinct('doc_id', error_rate=0.02), table)
+    assert len(result) == 1
+    assert abs(result[0]['distinct_doc_id'] - 1000) <= 60
+
+
+def test_approx_distinct_by_key_and_merge():
+    operation = mrop.ApproxDistinct('doc_id', key=['word'],
+                                    result_column='docs')
+    result = run(operation, table)
+    assert [row['word'] for row in result[:2]] == ['word_0', 'word_1']
+    assert all(abs(row['docs'] - 20) <= 1 for row in result)
+    partials = [operation.partial(table[:2500]),
+                operation.partial(table[2500:])]
+    assert list(operation.merge(partials)) == result
+
+
+def test_heavy_hitters():
+    rows = [{'word': 'often'}] * 300 + [{'word': 'rare'}] * 5 + \
+        [{'word': 'medium'}] * 100 + \
+        [{'word': 'other_{}'.format(index)} for index in range(1000)]
+    result = run(mrop.HeavyHitters('word', 2, error_rate=0.01), rows)
+    assert [row['word'] for row in result] == ['often', 'medium']
+    assert 300 <= result[0]['count'] <= 300 + 0.01 * len(rows)
+
+
+def test_count_min_sketch():
+    first, second = mrop.CountMinSketch(), mrop.CountMinSketch()
+    for index in range(1000):
+        first.add(index % 10)
+        second.add('value')
+    merged = first.merge(second)
+    assert merged.estimate(3) >= 100
+    assert merged.estimate('value') >= 1000
+    assert merged.estimate(3) <= 100 + 0.001 * merged.total + 1
+
+
+def test_hyper_log_log_switches_to_registers():
+    sparse, dense = mrop.HyperLogLog(), mrop.HyperLogLog()
+    for index in range(100):
+        sparse.add(index)
+    for index in range(50, 5000):
+        dense.add(index)
+    assert sparse.registers is None and sparse.estimate() == 100
+    assert dense.hashes is None
+    merged = sparse.merge(dense)
+    assert abs(merged.estimate() - 5000) <= 250
+    assert merged.merge(sparse).registers == merged.registers
+
+
+def test_space_saving_evicts_the_rarest_value():
+    summary = mrop.SpaceSaving(3)
+    for value in 'aaabbcd':
+        summary.add(value)
+    # 'c' (count 1) was replaced by 'd' with count 2
+    assert summary.counters == {'a': 3, 'b': 2, 'd': 2}
+    assert summary.min_count() == 2
+    for index in range(1000):
+        summary.add(index)
+    assert len(summary.heap) <= 2 * summary.capacity + 64
+    assert summary.min_count() == min(summary.counters.values())
+    assert summary.total == 1007
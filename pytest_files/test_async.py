@@ -0,0 +1,74 @@
+import sys
+import json
+import asyncio
+import pytest
+sys.path.append("..")
+import mrop
+
+
+def split_text(row):
+    for word in row['text'].split():
+        yield {'word': word}
+
+
+def build_graph():
+    graph = mrop.ComputationalGraph(source='main_input')
+    graph.add_operation(mrop.Map(split_text))
+    graph.add_operation(mrop.Sort(['word']))
+    graph.add_operation(mrop.Reduce(mrop.count_rows(), ['word'],
+                                    streaming=True))
+    return graph
+
+
+async def lines(texts):
+    for text in texts:
+        await asyncio.sleep(0)
+        yield json.dumps({'text': text}) + '\n'
+
+
+async def collect(graph, texts, **kwargs):
+    return [row async for row in graph.run_async(main_input=lines(texts),
+                                                 **kwargs)]
+
+
+def test_async_rows():
+    result = asyncio.run(collect(build_graph(), ['b a', 'a c'],
+                                 chunk_size=1))
+    assert result == [{'word': 'a', 'count': 2}, {'word': 'b', 'count': 1},
+                      {'word': 'c', 'count': 1}]
+
+
+def test_concurrent_jobs_and_plain_inputs():
+    async def plain_rows():
+        graph = build_graph()
+        return [row async for row in
+                graph.run_async(main_input=[{'text': 'x y x'}])]
+
+    async def jobs():
+        return await asyncio.gather(collect(build_graph(), ['a a']),
+                                    collect(build_graph(), ['b']),
+                                    plain_rows())
+
+    assert asyncio.run(jobs()) == [[{'word': 'a', 'count': 2}],
+                                   [{'word': 'b', 'count': 1}],
+                                   [{'word': 'x', 'count': 2},
+                                    {'word': 'y', 'count': 1}]]
+
+
+def test_records_sample_and_unsupported_options():
+    graph = mrop.ComputationalGraph(source='main_input', schema=['word'])
+    graph.add_operation(mrop.Sort(['word']))
+    rows = [{'word': 'b'}, {'word': 'a'}, {'word': 'c'}]
+
+    async def sorted_rows(**kwargs):
+        return [row async for row in graph.run_async(main_input=rows,
+                                                      **kwargs)]
+
+    result = asyncio.run(sorted_rows(sample=mrop.Sample(first=2)))
+    assert result == [{'word': 'a'}, {'word': 'b'}]
+    assert all(type(row) is dict for row in result)
+    assert [line['estimated_rows'] for line in graph.sample_report] == [3, 3]
+    for options in ({'cluster': mrop.LocalCluster()},
+                    {'checkpoint_dir': '/nonexistent'}, {'resume': True}):
+        with pytest.raises(ValueError):
+            asyncio.run(sorted_rows(**options))
@@ -0,0 +1,157 @@
+import sys
+import io
+import os
+import json
+import tempfile
+import subprocess
+sys.path.append("..")
+import mrop
+
+
+corpus = ''.join(json.dumps({'doc_id': index, 'text': 'a b a'}) + '\n'
+                 for index in range(5))
+calls = []
+
+
+def split_text(row):
+    calls.append(row['doc_id'])
+    for word in row['text'].split():
+        yield {'doc_id': row['doc_id'], 'word': word}
+
+
+def count_words(rows):
+    yield {'word': rows[0]['word'], 'number': len(rows)}
+
+
+graph_split_words = mrop.ComputationalGraph(source='main_input')
+graph_split_words.add_operation(mrop.Map(split_text))
+
+graph = mrop.ComputationalGraph(source=graph_split_words)
+graph.add_operation(mrop.Sort(['word']))
+graph.add_operation(mrop.Reduce(count_words, ['word']))
+
+directory = tempfile.mkdtemp()
+
+
+class Output(io.StringIO):
+    def close(self):
+        self.text = self.getvalue()
+
+
+def run(**kwargs):
+    output = Output()
+    graph.run(main_input=io.StringIO(corpus), save_result=output,
+              checkpoint_dir=directory, **kwargs)
+    return output.text
+
+
+expected = '{"word": "a", "number": 10}\n{"word": "b", "number": 5}\n'
+
+
+def test_checkpoints_are_saved_and_loaded():
+    assert run() == expected
+    assert sorted(os.listdir(directory)) == ['graph_0.pkl', 'graph_1.pkl']
+    del calls[:]
+    assert run(resume=True) == expected
+    assert calls == []
+
+
+def test_changed_graph_is_recomputed():
+    run()
+    graph_split_words.add_operation(mrop.Sort(['doc_id']))
+    del calls[:]
+    assert run(resume=True) == expected
+    assert len(calls) == 5
+    graph_split_words.list_of_operations.pop()
+
+
+def test_changed_input_is_recomputed():
+    run()
+    output = Output()
+    graph.run(main_input=io.StringIO(corpus.replace('b', 'c')),
+              save_result=output, checkpoint_dir=directory, resume=True)
+    assert output.text == '{"word": "a", "number": 10}\n' \
+                          '{"word": "c", "number": 5}\n'
+
+
+def make_mapper(body):
+    namespace = {}
+    exec('def mapper(row):\n    yield {}\n'.format(body), namespace)
+    return namespace['mapper']
+
+
+def test_changed_function_is_recomputed():
+    mapper_directory = tempfile.mkdtemp()
+
+    def run_mapper(mapper, main_input):
+        mapper_graph = mrop.ComputationalGraph(source='main_input')
+        mapper_graph.add_operation(mrop.Map(mapper))
+        mapper_graph.run(main_input=main_input, save_result=Output(),
+                         checkpoint_dir=mapper_directory, resume=True)
+        return mapper_graph.result
+
+    rows = [{'x': 0}]
+    assert run_mapper(make_mapper("{'x': 1}"), rows) == [{'x': 1}]
+    assert run_mapper(make_mapper("{'x': 2}"), rows) == [{'x': 2}]
+    assert run_mapper(lambda row: [{'x': 3}], rows) == [{'x': 3}]
+    assert run_mapper(lambda row: [{'x': 4}], rows) == [{'x': 4}]
+    # generator can't be fingerprinted, so it isn't checkpointed
+    assert run_mapper(lambda row: [row], iter(rows)) == rows
+    assert run_mapper(lambda row: [row], iter([{'x': 5}])) == [{'x': 5}]
+
+
+def count_sketch(state, row):
+    state['sketch'].add(row['word'])
+    return state
+
+
+def estimate_words(row):
+    calls.append(row['word'])
+    yield {'word': row['word'], 'number': row['number'],
+           'estimate': row['sketch'].estimate(row['word'])}
+
+
+fresh_graphs = []
+
+
+def run_fresh_graphs(checkpoint_dir):
+    """
+    Build new graph objects (at new addresses, old ones are kept) and
+    run them with resume from checkpoint_dir.
+    :return: output and number of rows mapped by split_text and
+    estimate_words;
+    """
+    split_words = mrop.ComputationalGraph(source='main_input')
+    split_words.add_operation(mrop.Map(split_text))
+    words = mrop.ComputationalGraph(source=split_words)
+    words.add_operation(mrop.Sort(['word']))
+    words.add_operation(mrop.Reduce(count_words, ['word']))
+    sketch = mrop.ComputationalGraph(source=split_words)
+    sketch.add_operation(mrop.Fold(count_sketch,
+                                   {'sketch': mrop.CountMinSketch()}))
+    estimates = mrop.ComputationalGraph(source=words)
+    estimates.add_operation(mrop.Join(on=sketch))
+    estimates.add_operation(mrop.Map(estimate_words))
+    fresh_graphs.append(estimates)
+    output = Output()
+    del calls[:]
+    estimates.run(main_input=io.StringIO(corpus), save_result=output,
+                  checkpoint_dir=checkpoint_dir, resume=True)
+    return output.text, len(calls)
+
+
+def test_resume_in_another_process():
+    checkpoint_dir = tempfile.mkdtemp()
+    text, mapped = run_fresh_graphs(checkpoint_dir)
+    assert mapped == 7
+    assert run_fresh_graphs(checkpoint_dir) == (text, 0)
+    process = subprocess.run(
+        [sys.executable, '-c',
+         'import json, test_checkpoint\n'
+         'print(json.dumps(test_checkpoint.run_fresh_graphs({!r})))'.
+         format(checkpoint_dir)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, PYTHONHASHSEED='1',
+                 PYTHONPATH=os.path.dirname(os.path.abspath(mrop.__file__))),
+        stdout=subprocess.PIPE, check=True)
+    assert json.loads(process.stdout) == [text, 0]
@@ -0,0 +1,154 @@
+import sys
+import io
+import os
+import json
+import math
+import tempfile
+import pytest
+sys.path.append("..")
+import mrop
+
+
+words = ['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta']
+corpus = ''.join(
+    json.dumps({'doc_id': 'doc_{}'.format(index),
+                'text': ' '.join(words[(index * step) % 7]
+                                 for step in range(1, 12))}) + '\n'
+    for index in range(40))
+marker = os.path.join(tempfile.mkdtemp(), 'failed_once')
+
+
+def split_text(row):
+    for word in row['text'].split():
+        yield {'doc_id': row['doc_id'], 'word': word}
+
+
+def split_text_failing_once(row):
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    yield from split_text(row)
+
+
+def count_documents(state, row):
+    state['docs_count'] += 1
+    return state
+
+
+def docs_with_word(rows):
+    yield {'word': rows[0]['word'], 'docs': len(rows),
+           'docs_count': rows[0]['docs_count']}
+
+
+def frequency(rows):
+    yield {'doc_id': rows[0]['doc_id'], 'word': rows[0]['word'],
+           'frequency': len(rows)}
+
+
+def tf_idf(row):
+    yield {'doc_id': row['doc_id'], 'word': row['word'],
+           'tf-idf': row['frequency'] * math.log(row['docs_count'] /
+                                                 row['docs'])}
+
+
+def build_graph(mapper):
+    graph_count_docs = mrop.ComputationalGraph(source='main_input')
+    graph_count_docs.add_operation(
+        mrop.Fold(count_documents, {'docs_count': 0}))
+
+    graph_split_words = mrop.ComputationalGraph(source='main_input')
+    graph_split_words.add_operation(mrop.Map(mapper))
+
+    graph_idf = mrop.ComputationalGraph(source=graph_split_words)
+    graph_idf.add_operation(mrop.Sort(['doc_id', 'word']))
+    graph_idf.add_operation(mrop.Reduce(mrop.first_row(), ['doc_id', 'word'],
+                                        streaming=True))
+    graph_idf.add_operation(mrop.Join(on=graph_count_docs,
+                                      key=['word', 'docs_count'],
+                                      strategy='outer'))
+    graph_idf.add_operation(mrop.Sort(['word']))
+    graph_idf.add_operation(mrop.Reduce(docs_with_word, ['word']))
+
+    graph = mrop.ComputationalGraph(source=graph_split_words)
+    graph.add_operation(mrop.Sort(['doc_id', 'word']))
+    graph.add_operation(mrop.Reduce(frequency, ['doc_id', 'word']))
+    graph.add_operation(mrop.Join(on=graph_idf, key='word', strategy='left'))
+    graph.add_operation(mrop.Map(tf_idf))
+    graph.add_operation(mrop.TopK(2, key=['tf-idf'], group_by=['word']))
+    graph.add_operation(mrop.Reduce(mrop.count_rows(), ['word'],
+                                    streaming=True))
+    return graph
+
+
+def run(graph, cluster=None):
+    graph.run(main_input=io.StringIO(corpus), save_result=io.StringIO(),
+              cluster=cluster)
+    return graph.result
+
+
+expected = run(build_graph(split_text))
+
+
+def test_cluster_result_is_the_same():
+    cluster = mrop.LocalCluster(workers=3, rows_per_partition=1)
+    assert run(build_graph(split_text), cluster) == expected
+
+
+def keep_word(row):
+    yield {'word': row['word']}
+
+
+def test_reduce_keeps_order_of_rows():
+    rows = [{'word': 'w{:02d}'.format(index * 7 % 40)} for index in range(200)]
+    graph = mrop.ComputationalGraph(source='main_input')
+    graph.add_operation(mrop.Sort(['word']))
+    graph.add_operation(mrop.Map(keep_word))
+    graph.add_operation(mrop.Reduce(mrop.count_rows(), ['word'],
+                                    streaming=True))
+    expected = [{'word': 'w{:02d}'.format(index), 'count': 5}
+                for index in range(40)]
+    for rows_per_partition in (1, 10, 1000):
+        cluster = mrop.LocalCluster(workers=3,
+                                    rows_per_partition=rows_per_partition)
+        graph.run(main_input=rows, save_result=io.StringIO(),
+                  cluster=cluster)
+        assert graph.result == expected
+
+
+def test_reduce_of_unsorted_rows_groups_consecutive_rows():
+    rows = [{'word': word} for word in 'bbaabccaa']
+    graph = mrop.ComputationalGraph(source='main_input')
+    graph.add_operation(mrop.Map(keep_word))
+    graph.add_operation(mrop.Reduce(mrop.count_rows(), ['word'],
+                                    streaming=True))
+    graph.run(main_input=rows, save_result=io.StringIO())
+    expected = graph.result
+    assert [row['count'] for row in expected] == [2, 2, 1, 2, 2]
+    graph.run(main_input=rows, save_result=io.StringIO(),
+              cluster=mrop.LocalCluster(workers=3, rows_per_partition=1))
+    assert graph.result == expected
+
+
+def test_small_table_is_not_partitioned():
+    cluster = mrop.LocalCluster(workers=3)
+    assert run(build_graph(split_text), cluster) == expected
+    assert cluster.partitions() == 1
+    assert all(partitioning in (None, ('single',)) or partitioning[2] == []
+               for partitioning in cluster.partitioning.values())
+    assert ('range', ['word'], []) in cluster.partitioning.values()
+
+
+def test_failed_worker_is_restarted():
+    result = run(build_graph(split_text_failing_once),
+                 mrop.LocalCluster(workers=2, rows_per_partition=1))
+    assert os.path.exists(marker)
+    assert result == expected
+
+
+def test_cluster_rejects_options_of_single_process_run():
+    for option in ({'sample': mrop.Sample(first=1)},
+                   {'checkpoint_dir': tempfile.mkdtemp()}, {'resume': True}):
+        with pytest.raises(ValueError):
+            build_graph(split_text).run(
+                main_input=io.StringIO(corpus), save_result=io.StringIO(),
+                cluster=mrop.LocalCluster(), **option)
@@ -0,0 +1,96 @@
+import sys
+import io
+import json
+import pytest
+sys.path.append("..")
+import mrop
+
+
+corpus = ''.join(json.dumps({'doc_id': index, 'text': 'b a b'}) + '\n'
+                 for index in range(4))
+
+
+def split_text(row):
+    for word in row['text'].split():
+        yield {'doc_id': row['doc_id'], 'word': word}
+
+
+def count_docs(state, row):
+    state['docs_count'] += 1
+    return state
+
+
+def count_words(rows):
+    yield {'word': rows[0]['word'], 'number': len(rows),
+           'docs_count': rows[0]['docs_count']}
+
+
+class Output(io.StringIO):
+    def close(self):
+        self.text = self.getvalue()
+
+
+def build_graph():
+    graph_split_words = mrop.ComputationalGraph(source='main_input')
+    graph_split_words.add_operation(mrop.Map(split_text))
+    graph_count_docs = mrop.ComputationalGraph(source='main_input')
+    graph_count_docs.add_operation(mrop.Fold(count_docs, {'docs_count': 0}))
+    graph = mrop.ComputationalGraph(source=graph_split_words)
+    graph.add_operation(mrop.Join(on=graph_count_docs))
+    graph.add_operation(mrop.Sort(['word']))
+    graph.add_operation(mrop.Reduce(count_words, ['word']))
+    return graph
+
+
+expected = '{"word": "a", "number": 4, "docs_count": 4}\n' \
+           '{"word": "b", "number": 8, "docs_count": 4}\n'
+
+
+def test_verbose_run_of_unnamed_graphs(capsys):
+    graph = build_graph()
+    output = Output()
+    graph.run(main_input=io.StringIO(corpus), save_result=output,
+              verbose=True)
+    assert output.text == expected
+    printed = capsys.readouterr().out
+    assert 'graph_2: Join by broadcast algorithm' in printed
+    assert 'Reduce(reducer=count_words' in printed
+
+
+def test_explain_without_run():
+    graph = build_graph()
+    lines = graph.explain().splitlines()
+    assert lines[0] == 'graph_0 (source: main_input)'
+    assert lines[4] == 'graph_2 (source: graph_0, depends on: graph_0, ' \
+                       'graph_1)'
+    assert lines[5] == '    Join(on=graph_1, strategy=\'outer\') ' \
+                       '[algorithm: chosen at run]'
+    assert lines[7].startswith("    Reduce(reducer=count_words, "
+                               "keys_to_group_by=['word']")
+    assert graph.explain(format='dot').startswith('digraph plan {')
+    with pytest.raises(ValueError):
+        graph.explain(format='html')
+
+
+def test_explain_analyze():
+    graph = build_graph()
+    output = Output()
+    plan = json.loads(graph.explain(analyze=True, format='json',
+                                    main_input=io.StringIO(corpus),
+                                    save_result=output))
+    assert output.text == expected
+    assert [entry['rows'] for entry in plan['graphs']] == [12, 1, 2]
+    operations = plan['graphs'][2]['operations']
+    assert [node['operation'] for node in operations] == \
+        ['InputDataNode', 'Join', 'Sort', 'Reduce']
+    assert [node['rows'] for node in operations] == [12, 12, 12, 2]
+    assert [node['algorithm'] for node in operations[1:]] == \
+        ['broadcast', 'sort', 'sort']
+    assert all(node['time'] >= 0 for node in operations)
+    assert all(node['peak_memory'] >= 0 for node in operations)
+    # Sort keeps the whole table, Reduce pulls it from Sort
+    assert operations[3]['peak_memory'] >= operations[2]['peak_memory'] > \
+        operations[1]['peak_memory']
+    assert plan['graphs'][2]['peak_memory'] > 0
+    assert 'rows: 12' in mrop._render_plan_text(plan)
+    assert '"2.1" [label="Join' in mrop._render_plan_dot(plan)
@@ -0,0 +1,157 @@
+import sys
+import io
+import json
+import pytest
+sys.path.append("..")
+import mrop
+
+
+words = ['b', 'a', 'c', 'a', 'b', 'a']
+corpus = ''.join(json.dumps({'doc_id': index, 'word': word}) + '\n'
+                 for index, word in enumerate(words))
+
+
+def count_docs(state, row):
+    state['docs_count'] += 1
+    return state
+
+
+def count_words(rows):
+    yield {'word': rows[0]['word'], 'number': len(rows)}
+
+
+class Output(io.StringIO):
+    def close(self):
+        self.text = self.getvalue()
+
+
+def run(graph):
+    graph.run(main_input=io.StringIO(corpus), save_result=Output())
+    return graph.result
+
+
+def join_tables(left_table, right_table, strategy=None, key='word'):
+    join = mrop.Join(on=mrop._PartitionSource(right_table),
+                     strategy=strategy, key=key)
+    join.set_iter_from_previous_node(iter(left_table))
+    return list(join), join.algorithm
+
+
+left_table = [{'word': 'b', 'left': 1}, {'word': 'a', 'left': 2},
+              {'word': 'b', 'left': 3}]
+right_table = [{'word': 'b', 'right': 4}, {'word': 'c', 'right': 5},
+               {'word': 'b', 'right': 6}]
+joined = [{'word': 'b', 'left': 1, 'right': 4},
+          {'word': 'b', 'left': 1, 'right': 6},
+          {'word': 'b', 'left': 3, 'right': 4},
+          {'word': 'b', 'left': 3, 'right': 6}]
+
+
+def test_join_algorithms_give_the_same_result():
+    assert join_tables(left_table, right_table) == (joined, 'hash')
+    sorted_left = sorted(left_table, key=lambda row: row['word'])
+    sorted_right = sorted(right_table, key=lambda row: row['word'])
+    assert join_tables(sorted_left, sorted_right) == (joined, 'merge')
+    rows, algorithm = join_tables(right_table, left_table, 'right')
+    assert algorithm == 'hash'
+    assert rows == joined
+
+
+def test_join_of_small_table_doesnt_sort_big_one():
+    big_table = left_table * 3 + [{'word': 'a', 'left': 7}]
+    small_table = [{'word': 'b', 'right': 4}, {'word': 'a', 'right': 5}]
+    rows, algorithm = join_tables(big_table, small_table)
+    assert algorithm == 'grouped_hash'
+    assert rows == join_tables(sorted(big_table, key=lambda row: row['word']),
+                               small_table)[0]
+    assert [row['left'] for row in rows] == [2, 2, 2, 7, 1, 3, 1, 3, 1, 3]
+    rows, algorithm = join_tables(small_table, big_table, 'right')
+    assert algorithm == 'grouped_hash'
+    assert len(rows) == 10
+
+
+def test_join_without_key_is_outer():
+    rows, algorithm = join_tables(left_table, [{'docs_count': 2}], key=None)
+    assert algorithm == 'broadcast'
+    assert rows == [dict(row, docs_count=2) for row in left_table]
+    with pytest.raises(TypeError):
+        mrop.Join(on=mrop._PartitionSource([]), strategy='left')
+    with pytest.raises(KeyError):
+        mrop.Join(on=mrop._PartitionSource([]), strategy='inner', key='word')
+
+
+def test_statistics_choose_grouping():
+    graph_count_docs = mrop.ComputationalGraph(source='main_input')
+    graph_count_docs.add_operation(mrop.Fold(count_docs, {'docs_count': 0}))
+    graph_sorted = mrop.ComputationalGraph(source='main_input')
+    graph_sorted.add_operation(mrop.Sort(['word']))
+    graph_sorted.add_operation(mrop.Join(on=graph_count_docs))
+    graph = mrop.ComputationalGraph(source=graph_sorted)
+    graph.add_operation(mrop.Sort(['word']))
+    graph.add_operation(mrop.Reduce(count_words, ['word']))
+    graph_words = mrop.ComputationalGraph(source='main_input')
+    graph_unsorted = mrop.ComputationalGraph(source=graph_words)
+    graph_unsorted.add_operation(mrop.Sort(['word']))
+    graph_unsorted.add_operation(mrop.Reduce(count_words, ['word']))
+    graph_input = mrop.ComputationalGraph(source='main_input')
+    graph_input.add_operation(mrop.Sort(['word']))
+    graph_input.add_operation(mrop.Reduce(count_words, ['word']))
+    expected = [{'word': 'a', 'number': 3}, {'word': 'b', 'number': 2},
+                {'word': 'c', 'number': 1}]
+
+    assert run(graph) == expected
+    assert graph_sorted.statistics.rows == 6
+    assert graph_sorted.statistics.is_sorted_by(['word'])
+    assert graph_sorted.statistics.distinct == {'word': 3}
+    assert graph_sorted.statistics.sampled == 6
+    assert [graph.list_of_operations[1].algorithm,
+            graph.list_of_operations[2].algorithm] == ['skip', 'sort']
+
+    assert run(graph_unsorted) == expected
+    assert [graph_unsorted.list_of_operations[1].algorithm,
+            graph_unsorted.list_of_operations[2].algorithm] == \
+        ['skip', 'hash']
+
+    # without statistics of input the number of groups is unknown
+    assert run(graph_input) == expected
+    assert [graph_input.list_of_operations[1].algorithm,
+            graph_input.list_of_operations[2].algorithm] == ['sort', 'sort']
+
+
+def test_statistics_of_distinct_key_tuples():
+    rows = [{'doc_id': index % 4, 'word': word}
+            for index, word in enumerate(words * 2)]
+    statistics = mrop.Statistics.collect(
+        rows, [['doc_id'], ['doc_id', 'word'], ['doc_id', 'word']],
+        [['word'], ['doc_id', 'word']])
+    assert statistics.sorted_by == []
+    assert statistics.distinct == {'word': 3, 'doc_id,word': 6}
+    assert statistics.distinct_share(['doc_id', 'word']) == 0.5
+    assert statistics.distinct_share(['doc_id']) is None
+    rows.sort(key=lambda row: (row['doc_id'], row['word']))
+    assert mrop.Statistics.collect(rows, [['doc_id'], ['doc_id', 'word']]). \
+        sorted_by == [['doc_id', 'word'], ['doc_id']]
+
+
+def test_hash_grouping_with_streaming_reducer():
+    reduce = mrop.Reduce(mrop.count_rows(), ['word'], streaming=True)
+    reduce.algorithm = 'hash'
+    reduce.set_iter_from_previous_node(
+        iter([{'word': word} for word in words]))
+    assert list(reduce) == [{'word': 'a', 'count': 3},
+                            {'word': 'b', 'count': 2},
+                            {'word': 'c', 'count': 1}]
+
+
+def count_tags(rows):
+    yield {'tags': rows[0]['tags'], 'n': len(rows)}
+
+
+def test_hash_grouping_of_unhashable_keys():
+    graph = mrop.ComputationalGraph(source='main_input')
+    graph.add_operation(mrop.Sort(['tags']))
+    graph.add_operation(mrop.Reduce(count_tags, ['tags']))
+    graph.run(main_input=[{'tags': ['b']}, {'tags': ['a']}, {'tags': ['a']}],
+              save_result=Output())
+    assert graph.result == [{'tags': ['a'], 'n': 2}, {'tags': ['b'], 'n': 1}]
+    assert graph.list_of_operations[2].algorithm == 'sort'
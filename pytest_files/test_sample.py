@@ -0,0 +1,86 @@
+import sys
+import io
+import json
+sys.path.append("..")
+import mrop
+
+
+docs = [{'doc_id': index, 'text': 'word_{} common'.format(index % 7)}
+        for index in range(200)]
+corpus = ''.join(json.dumps(doc) + '\n' for doc in docs)
+
+
+def split_text(row):
+    for word in row['text'].split():
+        yield {'doc_id': row['doc_id'], 'word': word}
+
+
+def count_documents(state, row):
+    state['docs_count'] += 1
+    return state
+
+
+graph_split_words = mrop.ComputationalGraph(source='main_input')
+graph_split_words.name = 'split_words'
+graph_split_words.add_operation(mrop.Map(split_text))
+
+graph_docs = mrop.ComputationalGraph(source='main_input')
+graph_docs.add_operation(mrop.Fold(count_documents, {'docs_count': 0}))
+
+graph = mrop.ComputationalGraph(source=graph_split_words)
+graph.name = 'join_docs'
+graph.add_operation(mrop.Join(on=graph_docs, key=['word', 'docs_count'],
+                              strategy='outer'))
+
+
+def run(sample=None):
+    graph.run(main_input=io.StringIO(corpus), save_result=io.StringIO(),
+              sample=sample)
+    return graph.result
+
+
+def test_first_rows_and_report():
+    result = run(mrop.Sample(first=10))
+    assert len(result) == 20
+    assert result[0]['docs_count'] == 10
+    report = {(line['graph'], line['operation']): line
+              for line in graph.sample_report}
+    assert report[('split_words', 'InputDataNode')]['rows'] == 10
+    assert report[('split_words', 'InputDataNode')]['estimated_rows'] == 200
+    assert report[('join_docs', 'Join')]['estimated_rows'] == 400
+    assert report[('graph_1', 'Fold')]['estimated_rows'] == 1
+
+
+def test_fraction_is_deterministic():
+    first = run(mrop.Sample(fraction=0.3, seed=1))
+    second = run(mrop.Sample(fraction=0.3, seed=1))
+    assert first == second
+    assert 0 < len(first) < 400
+
+
+def test_key_sample_and_full_run_after_sample():
+    result = run(mrop.Sample(fraction=0.5, key=['doc_id']))
+    assert all(row['docs_count'] == len(result) // 2 for row in result)
+    assert len(run()) == 400
+    assert run()[0]['docs_count'] == 200
+
+
+def test_fixed_size_outputs_are_not_extrapolated():
+    graph_top = mrop.ComputationalGraph(source=graph_split_words)
+    graph_top.add_operation(mrop.TopK(3, key=['doc_id']))
+    graph_top.add_operation(mrop.Map(lambda row: [row]))
+    graph_top.add_operation(mrop.Join(on=graph_split_words, key='doc_id'))
+    graph_distinct = mrop.ComputationalGraph(source=graph_top)
+    graph_distinct.add_operation(mrop.ApproxDistinct('word'))
+    graph_distinct.add_operation(mrop.Join(on=graph_docs))
+    graph_distinct.add_operation(mrop.Join(on=graph_top))
+    graph_distinct.run(main_input=io.StringIO(corpus),
+                       save_result=io.StringIO(),
+                       sample=mrop.Sample(first=20))
+    estimated = [(line['operation'], line['rows'], line['estimated_rows'])
+                 for line in graph_distinct.sample_report
+                 if line['graph'] in ('graph_1', 'graph_3')]
+    assert estimated == [('InputDataNode', 40, 400), ('TopK', 3, 3),
+                         ('Map', 3, 3), ('Join', 6, 60),
+                         ('InputDataNode', 6, 60), ('ApproxDistinct', 1, 1),
+                         ('Join', 1, 1), ('Join', 6, 60)]
@@ -0,0 +1,81 @@
+import sys
+import io
+import pickle
+sys.path.append("..")
+import mrop
+
+
+def split_text(row):
+    for word in row['text'].split():
+        yield (row['doc_id'], word, len(word))
+
+
+def count_words(rows):
+    yield {'word': rows[0]['word'], 'number': len(rows)}
+
+
+data = [{'doc_id': 'first_text', 'text': 'hello world hello'},
+        {'doc_id': 'second_text', 'text': 'world again'}]
+
+mapper_node = mrop.Map(split_text, schema=['doc_id', 'word', 'length'])
+mapper_node.previous_node_iter = iter(data)
+sorter_node = mrop.Sort(key=['word', 'doc_id'])
+sorter_node.set_iter_from_previous_node(iter(mapper_node))
+reducer_node = mrop.Reduce(count_words, ['word'])
+reducer_node.set_iter_from_previous_node(iter(sorter_node))
+result = list(reducer_node)
+
+
+def test_records_through_operations():
+    assert result == [{'word': 'again', 'number': 1},
+                      {'word': 'hello', 'number': 2},
+                      {'word': 'world', 'number': 2}]
+    assert all(isinstance(row, mrop.Record) for row in sorter_node.table)
+
+
+def test_record_dict_interface():
+    record = mrop.record_type(['doc_id', 'word']).from_row(
+        {'doc_id': 'first_text', 'word': 'hello', 'other': 1})
+    assert record['word'] == 'hello'
+    assert 'doc_id' in record and 'other' not in record
+    assert record.get('other', 0) == 0
+    assert dict(record) == {'doc_id': 'first_text', 'word': 'hello'}
+    assert record.key_getter(['word'])(record) == ('hello',)
+    assert record.key_getter(['word', 'doc_id'])(record) == \
+        ('hello', 'first_text')
+    assert pickle.loads(pickle.dumps(record)) == record
+    assert type(pickle.loads(pickle.dumps(record))) is type(record)
+
+
+def rebuild_some_rows(row):
+    if row['word'] == 'b':
+        yield {'doc_id': row['doc_id'], 'word': row['word']}
+    else:
+        yield row
+
+
+def test_records_mixed_with_dicts():
+    graph = mrop.ComputationalGraph(source='main_input',
+                                    schema=['doc_id', 'word'])
+    graph.add_operation(mrop.Map(rebuild_some_rows))
+    graph.add_operation(mrop.Sort(['doc_id', 'word']))
+    graph.add_operation(mrop.Sort(['word', 'doc_id']))
+    graph.run(main_input=[{'doc_id': 2, 'word': 'a'},
+                          {'doc_id': 1, 'word': 'b'},
+                          {'doc_id': 1, 'word': 'a'}],
+              save_result=io.StringIO())
+    assert [(row['doc_id'], row['word']) for row in graph.result] == \
+        [(1, 'a'), (2, 'a'), (1, 'b')]
+
+
+def test_sort_of_records_is_stable():
+    record = mrop.record_type(['doc_id', 'word', 'length'])
+    rows = [record((doc_id, word, len(word))) for doc_id, word in
+            [(2, 'b'), (1, 'a'), (1, 'b'), (2, 'a'), (3, 'a')]]
+    assert mrop.sort_rows(list(rows), ['word']) == \
+        [rows[1], rows[3], rows[4], rows[0], rows[2]]
+    assert mrop.sort_rows(list(rows), ['length', 'doc_id']) == \
+        [rows[1], rows[2], rows[0], rows[3], rows[4]]
+    dicts = [dict(row) for row in rows]
+    assert mrop.sort_rows(list(dicts), ['word']) == \
+        [dict(row) for row in mrop.sort_rows(list(rows), ['word'])]
@@ -0,0 +1,45 @@
+import sys
+sys.path.append("..")
+import mrop
+
+
+table = [{'doc_id': 'first_text', 'word': 'hello', 'count': 2},
+         {'doc_id': 'second_text', 'word': 'hello', 'count': 5},
+         {'doc_id': 'first_text', 'word': 'world', 'count': 1},
+         {'doc_id': 'third_text', 'word': 'world', 'count': 4},
+         {'doc_id': 'second_text', 'word': 'world', 'count': 3}]
+
+
+def reduce_table(reducer):
+    reducer_node = mrop.Reduce(reducer, ['word'], streaming=True)
+    reducer_node.previous_node_iter = iter(table)
+    return list(reducer_node)
+
+
+def test_count_rows():
+    assert reduce_table(mrop.count_rows('number')) == \
+        [{'word': 'hello', 'number': 2}, {'word': 'world', 'number': 3}]
+
+
+def test_sum_min_max():
+    assert reduce_table(mrop.sum_column('count')) == \
+        [{'word': 'hello', 'count': 7}, {'word': 'world', 'count': 8}]
+    assert reduce_table(mrop.min_column('count', 'min')) == \
+        [{'word': 'hello', 'min': 2}, {'word': 'world', 'min': 1}]
+    assert reduce_table(mrop.max_column('count', 'max')) == \
+        [{'word': 'hello', 'max': 5}, {'word': 'world', 'max': 4}]
+
+
+def test_first_and_top_k():
+    assert reduce_table(mrop.first_row()) == [table[0], table[2]]
+    assert reduce_table(mrop.top_k_rows(2, 'count')) == \
+        [table[1], table[0], table[3], table[4]]
+
+
+def test_partially_consumed_groups():
+    def first_doc(key, rows):
+        yield {'word': key['word'], 'doc_id': next(rows)['doc_id']}
+
+    assert reduce_table(first_doc) == \
+        [{'word': 'hello', 'doc_id': 'first_text'},
+         {'word': 'world', 'doc_id': 'first_text'}]
@@ -0,0 +1,34 @@
+import sys
+sys.path.append("..")
+import mrop
+
+
+table = [{'word': 'hello', 'doc_id': 'a', 'tf-idf': 0.5},
+         {'word': 'world', 'doc_id': 'a', 'tf-idf': 0.1},
+         {'word': 'hello', 'doc_id': 'b', 'tf-idf': 0.9},
+         {'word': 'hello', 'doc_id': 'c', 'tf-idf': 0.5},
+         {'word': 'world', 'doc_id': 'b', 'tf-idf': 0.7},
+         {'word': 'hello', 'doc_id': 'd', 'tf-idf': 0.2}]
+
+
+def top_k(operation, rows):
+    operation.previous_node_iter = iter(rows)
+    return list(operation)
+
+
+def test_global_top_k():
+    assert top_k(mrop.TopK(2, key=['tf-idf']), table) == [table[2], table[4]]
+    assert top_k(mrop.TopK(2, key=['tf-idf'], largest=False), table) == \
+        [table[1], table[5]]
+
+
+def test_top_k_by_group_keeps_order_of_ties():
+    result = top_k(mrop.TopK(3, key=['tf-idf'], group_by=['word']), table)
+    assert result == [table[2], table[0], table[3], table[4], table[1]]
+
+
+def test_partial_and_merge():
+    operation = mrop.TopK(2, key=['tf-idf'], group_by=['word'])
+    partials = [operation.partial(table[:3]), operation.partial(table[3:])]
+    assert list(operation.merge(partials)) == \
+        top_k(mrop.TopK(2, key=['tf-idf'], group_by=['word']), table)
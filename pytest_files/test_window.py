@@ -0,0 +1,87 @@
+import sys
+import io
+import json
+import tempfile
+from itertools import islice
+import pytest
+sys.path.append("..")
+import mrop
+
+
+def split(window, points):
+    return [(start, end, [row['time'] for row in rows])
+            for start, end, rows in window.split(
+                {'time': point} for point in points)]
+
+
+def test_windows_by_count():
+    assert split(mrop.Window(size=2), range(5)) == \
+        [(0, 2, [0, 1]), (2, 4, [2, 3]), (4, 6, [4])]
+    assert split(mrop.Window(size=3, step=2), range(5)) == \
+        [(0, 3, [0, 1, 2]), (2, 5, [2, 3, 4]), (4, 7, [4])]
+    with pytest.raises(ValueError):
+        mrop.Window(size=2, step=3)
+
+
+def test_windows_by_time():
+    window = mrop.Window(size=10, column='time')
+    assert split(window, [3, 7, 12, 45, 41, 30, 48]) == \
+        [(0, 10, [3, 7]), (10, 20, [12]), (40, 50, [45, 41, 48])]
+    assert window.late_rows == 1
+    assert split(mrop.Window(size=10, step=5, column='time'), [3, 7, 12]) == \
+        [(-5, 5, [3]), (0, 10, [3, 7]), (5, 15, [7, 12]), (10, 20, [12])]
+
+
+def lazy_rows():
+    yield {'time': 1, 'word': 'a'}
+    yield {'time': 2, 'word': 'b'}
+    yield {'time': 11, 'word': 'a'}
+    raise AssertionError("window was not emitted before the next row")
+
+
+def count_docs(state, row):
+    state['docs_count'] += 1
+    return state
+
+
+def test_run_stream():
+    docs = mrop.ComputationalGraph(source='docs')
+    docs.add_operation(mrop.Fold(count_docs, {'docs_count': 0}))
+    graph = mrop.ComputationalGraph(source='main_input')
+    graph.add_operation(mrop.Join(on=docs))
+    graph.add_operation(mrop.Sort(['word']))
+    graph.add_operation(mrop.Reduce(mrop.count_rows(), ['word', 'docs_count'],
+                                    streaming=True))
+    windows = graph.run_stream(mrop.Window(size=10, column='time'),
+                               main_input=lazy_rows(),
+                               docs=io.StringIO('{"id": 1}\n{"id": 2}\n'))
+    assert next(windows) == \
+        (0, 10, [{'word': 'a', 'docs_count': 2, 'count': 1},
+                 {'word': 'b', 'docs_count': 2, 'count': 1}])
+
+
+def test_follow():
+    with tempfile.NamedTemporaryFile('w') as writer:
+        writer.write(json.dumps({'word': 'a'}) + '\n{"word": ')
+        writer.flush()
+        lines = mrop.follow(open(writer.name, 'r'), poll_interval=0.01)
+        assert next(lines) == '{"word": "a"}\n'
+        writer.write('"b"}\n')
+        writer.flush()
+        assert list(islice(lines, 1)) == ['{"word": "b"}\n']
+
+
+def test_run_stream_yields_dicts():
+    graph = mrop.ComputationalGraph(source='main_input',
+                                    schema=['time', 'word'])
+    graph.add_operation(mrop.Sort(['word']))
+    windows = graph.run_stream(mrop.Window(size=2),
+                               main_input=io.StringIO(
+                                   '{"time": 1, "word": "b"}\n'
+                                   '{"time": 2, "word": "a"}\n'))
+    rows = next(windows)[2]
+    assert rows == [{'time': 2, 'word': 'a'}, {'time': 1, 'word': 'b'}]
+    assert all(type(row) is dict for row in rows)
+    with pytest.raises(ValueError):
+        next(graph.run_stream(mrop.Window(size=2), main_input=[],
+                              resume=True))